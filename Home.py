@@ -1,60 +1,188 @@
 import streamlit as st
 import cv2
-from ultralytics import YOLO
-import requests
-from PIL import Image
 import os
-from glob import glob
-from numpy import random
 import io
+import zipfile
+
+import json
+
+import detection
+import metrics
+import model_registry
+from detection_summary import DetectionSummary
+from fetch import FetchError, ImageFetcher, decode_image
+from result_cache import ResultCache, hash_bytes, model_version
+from tiling import Tiler
 
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'True'
 
+CACHE_DIR = "./uploads/cache"
+CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9102))
+# Uploaded images go through the model this many at a time
+BATCH_SIZE = 8
+GALLERY_PAGE_SIZE = 12
+GALLERY_COLUMNS = 3
+THUMBNAIL_SIZE = 480
+IMAGE_OUTPUTS = ("prediction.png", "thumbnail.jpg", "result.json")
+# Bumped whenever result.json changes shape, so older entries aren't read
+RESULT_VERSION = 2
+
 @st.cache_resource
-def load_model(model_path):
-    model = YOLO(model_path)
-    return model
-
-def predict_image(model, image, conf_threshold, iou_threshold):
-    res = model.predict(
-        image,
-        conf=conf_threshold,
-        iou=iou_threshold,
-        device='cpu',
-    )
-    
-    class_name = model.model.names
-    classes = res[0].boxes.cls
-    class_counts = {}
-    
-    for c in classes:
-        c = int(c)
-        class_counts[class_name[c]] = class_counts.get(class_name[c], 0) + 1
-
-    # Generate prediction text
-    prediction_text = 'Predicted '
-    for k, v in sorted(class_counts.items(), key=lambda item: item[1], reverse=True):
-        prediction_text += f'{v} {k}'
-        
-        if v > 1:
-            prediction_text += 's'
-        
-        prediction_text += ', '
+def preload_model():
+    # Load and warm up the shared model while the page renders
+    return model_registry.preload()
 
-    prediction_text = prediction_text[:-2]
-    if len(class_counts) == 0:
-        prediction_text = "No objects detected"
+@st.cache_resource
+def get_fetcher():
+    # Shared by all sessions: one connection pool and one cache of fetched images
+    return ImageFetcher()
 
-    # Calculate inference latency
-    latency = sum(res[0].speed.values())  # in ms, need to convert to seconds
-    latency = round(latency / 1000, 2)
-    prediction_text += f' in {latency} seconds.'
+@st.cache_resource
+def get_metrics_server():
+    # Prometheus /metrics for the whole app, shared with the other pages
+    return metrics.start_metrics_server(METRICS_PORT)
 
-    # Convert the result image to RGB
-    res_image = res[0].plot()
-    res_image = cv2.cvtColor(res_image, cv2.COLOR_BGR2RGB)
-    
-    return res_image, prediction_text
+@st.cache_resource
+def get_result_cache():
+    return ResultCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+def encode_result(prediction, summary, r):
+    # Files of one cache entry: the annotated PNG, a small JPEG for the
+    # gallery and the detections
+    frame = prediction[:, :, ::-1]
+    height, width = frame.shape[:2]
+    scale = THUMBNAIL_SIZE / max(height, width)
+    thumbnail = frame
+    if scale < 1:
+        thumbnail = cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    result = {"text": summary.text(), "summary": summary.to_dict(), "detections": detection.result_to_dict(r)}
+    return {
+        "prediction.png": cv2.imencode(".png", frame)[1].tobytes(),
+        "thumbnail.jpg": cv2.imencode(".jpg", thumbnail, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes(),
+        "result.json": json.dumps(result).encode(),
+    }
+
+def read_result(entry):
+    with open(os.path.join(entry, "result.json")) as f:
+        return json.load(f)
+
+def cached_predictions(model_path, items, conf_threshold, iou_threshold, tiler, on_progress=None):
+    # Cache entry for every (digest, data, image) item, reused when the same
+    # image was already run with the same model and settings; image may be
+    # None to decode data when needed. Misses are decoded and run through
+    # the model BATCH_SIZE at a time, and only they wait for the model. Items
+    # that can't be decoded get None.
+    cache = get_result_cache()
+    # Hash what actually runs, so switching MODEL_BACKEND never serves results
+    # of another backend
+    version = model_version(detection.resolve_model(model_path))
+    keys = [
+        cache.key(
+            digest, version, conf=conf_threshold, iou=iou_threshold, tiler=tiler, outputs=IMAGE_OUTPUTS,
+            result_version=RESULT_VERSION,
+        )
+        for digest, _, _ in items
+    ]
+    entries = [cache.get(key) for key in keys]
+    misses = [i for i, entry in enumerate(entries) if entry is None]
+
+    for start in range(0, len(misses), BATCH_SIZE):
+        batch, images = [], []
+        for i in misses[start:start + BATCH_SIZE]:
+            _, data, image = items[i]
+            try:
+                images.append(decode_image(data) if image is None else image)
+            except FetchError:
+                continue
+            batch.append(i)
+
+        if batch:
+            model = model_registry.get_model(model_path)
+            # Arrays decoded here are dropped afterwards, so boxes can be drawn
+            # into them; fetched ones are cached and must stay clean
+            copy = any(items[i][2] is not None for i in batch)
+            outputs = detection.predict_images(model, images, conf_threshold, iou_threshold, tiler, copy=copy)
+            for i, (prediction, summary, r) in zip(batch, outputs):
+                entries[i] = cache.put(keys[i], encode_result(prediction, summary, r))
+        if on_progress is not None:
+            on_progress(min(start + BATCH_SIZE, len(misses)) / len(misses))
+    return entries
+
+def upload_digest(uploaded_file):
+    # Hashes of this session's uploads, so paging through the gallery
+    # doesn't hash every file again
+    digests = st.session_state.setdefault("upload_digests", {})
+    if uploaded_file.id not in digests:
+        digests[uploaded_file.id] = hash_bytes(uploaded_file.getvalue())
+    return digests[uploaded_file.id]
+
+def build_zip(names, entries, results, total):
+    # Annotated PNGs plus detections.json with every box and summary.json
+    # for the whole set; the PNGs are already compressed, so they are
+    # stored as they are
+    buffer = io.BytesIO()
+    used = set()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, entry in zip(names, entries):
+            stem = os.path.splitext(name)[0]
+            arcname = f"{stem}_pred.png"
+            n = 1
+            while arcname in used:
+                n += 1
+                arcname = f"{stem}_{n}_pred.png"
+            used.add(arcname)
+            archive.write(os.path.join(entry, "prediction.png"), arcname, compress_type=zipfile.ZIP_STORED)
+        detections = [
+            {"source": name, "summary": result["summary"], "detections": result["detections"]}
+            for name, result in zip(names, results)
+        ]
+        archive.writestr("detections.json", json.dumps(detections, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+        archive.writestr("summary.json", json.dumps(total.to_dict(), indent=2), compress_type=zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+def show_gallery(names, entries):
+    # Class statistics over the whole set, then the annotated images a page
+    # at a time
+    results = [read_result(entry) for entry in entries]
+    total = DetectionSummary()
+    for result in results:
+        total.merge(DetectionSummary.from_dict(result["summary"]))
+    classes = total.classes()
+
+    columns = st.columns(len(classes) + 2)
+    columns[0].metric("Images", total.frames)
+    columns[1].metric("With detections", total.frames_with_detections)
+    for column, c in zip(columns[2:], classes):
+        column.metric(c.name.capitalize(), c.count, help=f"max confidence {c.max_conf:.2f}, mean {c.mean_conf:.2f}")
+
+    shown = list(range(len(results)))
+    if total.frames_with_detections and st.checkbox("Only show images with detections"):
+        shown = [i for i in shown if results[i]["summary"]["detections"]]
+    pages = max(1, -(-len(shown) // GALLERY_PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1) if pages > 1 else 1
+    shown = shown[(page - 1) * GALLERY_PAGE_SIZE:page * GALLERY_PAGE_SIZE]
+
+    columns = st.columns(GALLERY_COLUMNS)
+    for n, i in enumerate(shown):
+        with columns[n % GALLERY_COLUMNS]:
+            st.image(os.path.join(entries[i], "thumbnail.jpg"), caption=f"{names[i]}: {results[i]['text']}",
+                     use_column_width=True)
+            with open(os.path.join(entries[i], "prediction.png"), "rb") as f:
+                st.download_button("Download", f.read(), file_name=f"{os.path.splitext(names[i])[0]}_pred.png",
+                                   mime="image/png", key=f"download-{i}")
+
+    # Built on request, since it holds every annotated image in memory
+    zip_key = ("gallery_zip", tuple(entries))
+    if st.session_state.get("gallery_zip_key") != zip_key:
+        st.session_state.pop("gallery_zip", None)
+    if "gallery_zip" not in st.session_state and st.button("Prepare zip of all predictions"):
+        with st.spinner("Zipping"):
+            st.session_state["gallery_zip"] = build_zip(names, entries, results, total)
+            st.session_state["gallery_zip_key"] = zip_key
+    if "gallery_zip" in st.session_state:
+        st.download_button("Download all predictions (zip)", st.session_state["gallery_zip"],
+                           file_name="predictions.zip", mime="application/zip")
 
 def main():
     # Set Streamlit page configuration
@@ -168,58 +296,71 @@ def main():
             """
         )
 
-    # Load the selected model
-    model_path = "./model/best.pt"
-    model = load_model(model_path)
+    # Start loading the model; it is only waited for once there is an image
+    model_path = model_registry.MODEL_PATH
+    get_metrics_server()
+    preload_model()
 
     # Add a section divider
     st.markdown("---")
 
     
-    # Image selection
-    image = None
+    # Image selection: (name, digest, data, image) for every image to run
+    items = []
     image_source = st.radio("Select image source:", ("Enter URL", "Upload from Computer"))
     if image_source == "Upload from Computer":
-        uploaded_file = st.file_uploader("Upload an image", type=["png", "jpg", "jpeg"])
-        if uploaded_file is not None:
-            image = Image.open(uploaded_file)
-        else:
-            image = None
+        uploaded_files = st.file_uploader("Upload images", type=["png", "jpg", "jpeg"], accept_multiple_files=True)
+        # Decoded batch by batch when they are run, not all up front
+        items = [(f.name, upload_digest(f), f.getvalue(), None) for f in uploaded_files or []]
 
     else:
         url = st.text_input("Enter the image URL:")
         if url:
             try:
-                response = requests.get(url, stream=True)
-                if response.status_code == 200:
-                    image = Image.open(response.raw)
-                else:
-                    st.error("Error loading image from URL.")
-                    image = None
-            except requests.exceptions.RequestException as e:
+                image_data, image = get_fetcher().fetch(url.strip())
+                items = [(os.path.basename(url.split("?")[0]) or "image", hash_bytes(image_data), image_data, image)]
+            except FetchError as e:
                 st.error(f"Error loading image from URL: {e}")
-                image = None
 
-    if image:
+    # Tiled inference keeps small, distant fires visible in large drone frames
+    tiler = None
+    if st.checkbox("Tiled inference for high-resolution images"):
+        tile_size = st.select_slider("Tile size", options=[320, 480, 640, 960, 1280], value=640)
+        prepass = st.checkbox("Only tile regions flagged by a low-resolution pre-pass")
+        tiler = Tiler(tile_size=tile_size, prepass_imgsz=320 if prepass else None)
+
+    if items:
+        iou_threshold = 0.5
+        conf_threshold = 0.5
+        progress = st.progress(0.0) if len(items) > BATCH_SIZE else None
         with st.spinner("Detecting"):
-            iou_threshold = 0.5
-            conf_threshold = 0.5
-            prediction, text = predict_image(model, image, conf_threshold, iou_threshold)
+            entries = cached_predictions(
+                model_path, [item[1:] for item in items], conf_threshold, iou_threshold, tiler,
+                on_progress=progress.progress if progress is not None else None,
+            )
+        if progress is not None:
+            progress.empty()
+
+        failed = [item[0] for item, entry in zip(items, entries) if entry is None]
+        if failed:
+            st.error(f"Could not read {', '.join(failed)}")
+        names = [item[0] for item, entry in zip(items, entries) if entry is not None]
+        entries = [entry for entry in entries if entry is not None]
+
+        if len(entries) == 1:
+            with open(os.path.join(entries[0], "prediction.png"), "rb") as f:
+                prediction = f.read()
             st.image(prediction, caption="Prediction", use_column_width=True)
-            st.success(text)
-        
-        prediction = Image.fromarray(prediction)
-
-        image_buffer = io.BytesIO()
-
-        prediction.save(image_buffer, format='PNG')
-
-        st.download_button(
-            label='Download Prediction',
-            data=image_buffer.getvalue(),
-            file_name='prediciton.png',
-            mime='image/png'
-        )
+            st.success(read_result(entries[0])["text"])
+
+            st.download_button(
+                label='Download Prediction',
+                data=prediction,
+                file_name='prediciton.png',
+                mime='image/png'
+            )
+        elif entries:
+            show_gallery(names, entries)
 
     # Add a section divider
     st.markdown("---")
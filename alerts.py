@@ -0,0 +1,133 @@
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
+SMTP_USER = os.environ.get("SMTP_USER", "")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
+
+SENT = "sent"
+
+
+class SMTPConfigError(Exception):
+    pass
+
+# Connection drops and 4xx replies are worth retrying; 5xx replies are not
+TRANSIENT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+
+def build_message(sender, to_email, subject, message):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(message, 'plain'))
+    return msg
+
+
+def connect(host=SMTP_SERVER, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASSWORD, starttls=SMTP_STARTTLS, timeout=30):
+    # Logs in only with a password, so relays and local debug servers that
+    # take mail without authentication work too
+    server = smtplib.SMTP(host, port, timeout=timeout)
+    try:
+        if starttls:
+            server.starttls()
+        if password:
+            server.login(user, password)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def is_transient(error):
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and 400 <= error.smtp_code < 500
+
+
+def _sender(jobs, results, subject, message, max_retries, backoff, settings, fatal):
+    # One worker: keeps one authenticated connection open for many messages.
+    # fatal is shared by all workers and holds the error once connecting or
+    # logging in has failed for good; every remaining address fails with it
+    # rather than trying to log in again once per subscriber.
+    server = None
+    try:
+        while True:
+            to_email = jobs.get()
+            if to_email is None:
+                return
+            if fatal:
+                results[to_email] = f"Failed: {fatal[0]}"
+                continue
+
+            for attempt in range(max_retries + 1):
+                connected = False
+                try:
+                    if server is None:
+                        server = connect(**settings)
+                    connected = True
+                    server.send_message(build_message(settings["user"], to_email, subject, message))
+                    results[to_email] = SENT
+                    break
+                except Exception as e:
+                    # The connection may be in an unknown state; start a fresh one
+                    if isinstance(e, TRANSIENT_ERRORS) and server is not None:
+                        server.close()
+                        server = None
+                    if attempt == max_retries or not is_transient(e):
+                        results[to_email] = f"Failed: {e}"
+                        if not connected:
+                            fatal.append(e)
+                        break
+                    time.sleep(backoff * 2 ** attempt)
+    finally:
+        if server is not None:
+            try:
+                server.quit()
+            except smtplib.SMTPException:
+                server.close()
+
+
+def send_bulk_email(recipients, subject, message, connections=4, max_retries=3, backoff=1.0, **settings):
+    # Send to every address from an iterable (which may be a lazy generator)
+    # over a small pool of reused SMTP connections. Duplicate addresses are
+    # sent once. Returns {email: "sent" or "Failed: ..."}.
+    settings = {
+        "host": SMTP_SERVER, "port": SMTP_PORT, "user": SMTP_USER,
+        "password": SMTP_PASSWORD, "starttls": SMTP_STARTTLS, **settings,
+    }
+    # The user is the sender; the password is optional
+    if not settings["user"]:
+        raise SMTPConfigError("Email is not configured: set SMTP_USER")
+    jobs = queue.Queue(maxsize=connections * 4)
+    results = {}
+    fatal = []
+    workers = [
+        threading.Thread(
+            target=_sender, args=(jobs, results, subject, message, max_retries, backoff, settings, fatal), daemon=True,
+        )
+        for _ in range(max(1, connections))
+    ]
+    for worker in workers:
+        worker.start()
+
+    seen = set()
+    try:
+        for to_email in recipients:
+            if to_email and to_email not in seen:
+                seen.add(to_email)
+                jobs.put(to_email)
+    finally:
+        for _ in workers:
+            jobs.put(None)
+        for worker in workers:
+            worker.join()
+
+    return results
@@ -0,0 +1,162 @@
+import argparse
+import importlib.util
+import json
+import os
+import time
+from glob import glob
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+from detection import box_iou, predict_batch
+
+# Exported artifacts sit next to the .pt weights; dynamic axes keep batched
+# inference working
+EXPORTS = {
+    "onnx": {"suffix": ".onnx", "requires": "onnxruntime"},
+    "openvino": {"suffix": "_openvino_model", "requires": "openvino"},
+}
+
+
+def available_backends(weights=None):
+    backends = ["torch"]
+    for name, export in EXPORTS.items():
+        if importlib.util.find_spec(export["requires"]) is not None:
+            backends.append(name)
+
+    # The INT8 model only exists once quantize.py has been run
+    if "onnx" in backends and weights and os.path.exists(quantized_path(weights)):
+        backends.append("int8")
+    return backends
+
+
+def exported_path(weights, backend):
+    return os.path.splitext(weights)[0] + EXPORTS[backend]["suffix"]
+
+
+def quantized_path(weights):
+    return os.path.splitext(weights)[0] + "_int8.onnx"
+
+
+def export_model(weights, backend, imgsz=640):
+    if backend == "int8":
+        path = quantized_path(weights)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} does not exist, create it with quantize.py")
+        return path
+
+    # Export once and reuse the artifact until the .pt weights change
+    path = exported_path(weights, backend)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(weights):
+        return path
+
+    YOLO(weights).export(format=backend, imgsz=imgsz, dynamic=True)
+    return path
+
+
+def load_backend(weights, backend="torch"):
+    if backend == "torch":
+        return YOLO(weights)
+    if backend not in EXPORTS and backend != "int8":
+        raise ValueError(f"Unknown backend {backend!r}, expected torch, int8 or one of {', '.join(EXPORTS)}")
+    return YOLO(export_model(weights, backend), task="detect")
+
+
+def sample_frames(pattern=None, limit=8, imgsz=640):
+    # Frames used to time and check backends: the bundled test images when
+    # present, otherwise noise so selection still works on a bare install
+    pattern = pattern or os.path.join(os.path.dirname(os.path.abspath(__file__)), "test videos", "img*")
+    frames = [cv2.imread(path) for path in sorted(glob(pattern))[:limit]]
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (imgsz, imgsz, 3), dtype=np.uint8) for _ in range(limit)]
+    return frames
+
+
+def compare_results(reference, results, iou_threshold=0.5):
+    # Fraction of reference boxes that the other backend also found (same
+    # class, IoU above threshold) and the largest confidence difference
+    matched = total = 0
+    max_conf_delta = 0.0
+    for ref, res in zip(reference, results):
+        ref_boxes = ref.boxes.data.cpu().numpy()
+        boxes = res.boxes.data.cpu().numpy()
+        total += len(ref_boxes)
+        if not len(ref_boxes) or not len(boxes):
+            continue
+
+        iou = box_iou(ref_boxes[:, :4], boxes[:, :4])
+        iou[ref_boxes[:, 5:6] != boxes[:, 5][None]] = 0
+        best = iou.argmax(1)
+        hit = iou[np.arange(len(ref_boxes)), best] >= iou_threshold
+        matched += int(hit.sum())
+        if hit.any():
+            max_conf_delta = max(max_conf_delta, float(np.abs(ref_boxes[hit, 4] - boxes[best[hit], 4]).max()))
+
+    return {"recall": matched / total if total else 1.0, "max_conf_delta": max_conf_delta}
+
+
+def time_backend(model, frames, conf_threshold, iou_threshold, runs=3):
+    predict_batch(model, frames, conf_threshold, iou_threshold)  # warm-up
+    start = time.perf_counter()
+    for _ in range(runs):
+        res = predict_batch(model, frames, conf_threshold, iou_threshold)
+    return (time.perf_counter() - start) / runs / len(frames), res
+
+
+def benchmark_backends(weights, frames, conf_threshold=0.25, iou_threshold=0.5, backends=None):
+    # Time every backend on the same frames and check its detections against
+    # PyTorch, which is the reference
+    report = {}
+    reference = None
+    for backend in ["torch"] + [b for b in (backends or available_backends(weights)) if b != "torch"]:
+        try:
+            model = load_backend(weights, backend)
+            seconds, res = time_backend(model, frames, conf_threshold, iou_threshold)
+        except Exception as e:
+            report[backend] = {"error": str(e)}
+            continue
+
+        if reference is None:
+            reference = res
+        report[backend] = {"ms_per_frame": round(seconds * 1000, 2), **compare_results(reference, res)}
+
+    return report
+
+
+def select_backend(weights, frames, min_recall=0.95, cache=True):
+    # Pick the fastest backend whose detections agree with PyTorch, and
+    # remember the choice next to the weights so it only runs once per host
+    cache_path = os.path.splitext(weights)[0] + "_backend.json"
+    if cache and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(weights):
+        with open(cache_path) as f:
+            return json.load(f)["backend"]
+
+    report = benchmark_backends(weights, frames)
+    usable = {
+        name: r for name, r in report.items()
+        if "error" not in r and r["recall"] >= min_recall
+    }
+    backend = min(usable, key=lambda name: usable[name]["ms_per_frame"]) if usable else "torch"
+
+    if cache:
+        with open(cache_path, "w") as f:
+            json.dump({"backend": backend, "report": report}, f, indent=2)
+    return backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the model and compare inference backends")
+    parser.add_argument("--model", default="./model/best.pt")
+    parser.add_argument("--images", default=None, help="glob of images to time and compare on")
+    parser.add_argument("--conf", type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = benchmark_backends(args.model, sample_frames(args.images), conf_threshold=args.conf)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+from concurrent.futures import as_completed
+from glob import glob, has_magic
+
+import cv2
+
+from detection import (
+    FrameSampler,
+    HighlightRecorder,
+    annotate,
+    get_worker_model,
+    make_pool,
+    predict_batch,
+    process_video,
+    result_to_dict,
+    video_fps,
+)
+from detection_log import DetectionLog
+from detection_summary import DetectionSummary
+from tiling import Tiler
+from tracking import ByteTracker, TrackSampler
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".webp"}
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".avi", ".mkv"}
+
+
+def pattern_root(pattern):
+    # Directory part of a glob pattern before its first wildcard
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep)[:-1]:
+        if has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or "."
+
+
+def collect_files(inputs):
+    # Expand directories and globs into a sorted, de-duplicated list of
+    # (path, name) media files, where name is the path relative to the
+    # directory or pattern it was found through
+    files = {}
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            root = pattern
+            pattern = os.path.join(pattern, "**", "*")
+        else:
+            root = pattern_root(pattern)
+        for path in glob(pattern, recursive=True):
+            ext = os.path.splitext(path)[1].lower()
+            if ext in IMAGE_EXTENSIONS or ext in VIDEO_EXTENSIONS:
+                files.setdefault(path, os.path.relpath(path, root))
+    return sorted(files.items())
+
+
+def output_stems(output_dir, files):
+    # {path: output stem} mirroring each file's name below its input root, so
+    # a/img1.jpg and b/img1.jpg don't overwrite each other. Names that still
+    # clash (x.mp4 next to x.mov, the same name under two inputs, or the run's
+    # summary.json) get the extension and then a counter appended.
+    stems = {}
+    taken = {"summary"}
+    for path, name in files:
+        base, ext = os.path.splitext(name)
+        stem = base
+        if stem.lower() in taken:
+            base = stem = f"{base}_{ext[1:]}"
+        n = 2
+        while stem.lower() in taken:
+            stem = f"{base}_{n}"
+            n += 1
+        taken.add(stem.lower())
+        stems[path] = os.path.join(output_dir, stem)
+    return stems
+
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def detect_images(paths, stems, options):
+    model = get_worker_model()
+    frames = [cv2.imread(path) for path in paths]
+
+    # Skip anything OpenCV can't decode rather than failing the whole batch
+    paths = [path for path, frame in zip(paths, frames) if frame is not None]
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return paths, DetectionSummary()
+
+    res = predict_batch(model, frames, options["conf"], options["iou"], tiler=options["tiler"])
+
+    for path, r in zip(paths, res):
+        stem = stems[path]
+        cv2.imwrite(stem + "_pred.png", annotate(r.orig_img, r))
+        write_json(stem + ".json", {"source": path, "detections": result_to_dict(r)})
+
+    return paths, DetectionSummary.of(res)
+
+
+def detect_video(path, stem, options):
+    model = get_worker_model()
+    output_path = None if options["no_video"] else stem + "_processed.mp4"
+
+    fps = video_fps(path)
+
+    sampler = None
+    if options["every"] > 1 or options["diff_threshold"] is not None:
+        sampler = FrameSampler(every=options["every"], diff_threshold=options["diff_threshold"])
+
+    tracker = None
+    if options["track"]:
+        tracker = ByteTracker(high_thresh=options["conf"])
+        if options["skip_stable"] > 1:
+            sampler = TrackSampler(tracker, every=options["skip_stable"])
+
+    highlight = None
+    if options["highlights"]:
+        highlight = HighlightRecorder(stem + "_highlights.mp4", fps, min_conf=options["conf"])
+
+    summary = DetectionSummary()
+
+    if options["log_format"] != "json":
+        # Columnar log written incrementally, one row per box
+        with DetectionLog(f"{stem}.{options['log_format']}", fps) as log:
+            def on_result(index, r):
+                log.write(index, r)
+                summary.add(r)
+
+            process_video(
+                model, path, output_path, options["conf"], options["iou"],
+                batch_size=options["batch_size"], sampler=sampler, on_result=on_result, tiler=options["tiler"],
+                highlight=highlight, tracker=tracker,
+            )
+        if tracker is not None:
+            write_json(stem + "_tracks.json", {"source": path, "tracks": tracker.summary(fps)})
+        write_json(stem + "_summary.json", {"source": path, **summary.to_dict()})
+        return [path], summary
+
+    frames = []
+
+    def on_result(index, r):
+        frames.append({"frame": index, "detections": result_to_dict(r)})
+        summary.add(r)
+
+    process_video(
+        model, path, output_path, options["conf"], options["iou"],
+        batch_size=options["batch_size"], sampler=sampler, on_result=on_result, tiler=options["tiler"],
+        highlight=highlight, tracker=tracker,
+    )
+    data = {"source": path, "frames": frames}
+    if highlight is not None:
+        data["highlights"] = highlight.timestamps()
+    if tracker is not None:
+        data["tracks"] = tracker.summary(fps)
+    write_json(stem + ".json", data)
+    write_json(stem + "_summary.json", {"source": path, **summary.to_dict()})
+
+    return [path], summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fire/smoke detection over images and videos")
+    parser.add_argument("inputs", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default="./outputs", help="directory for annotated files and JSON")
+    parser.add_argument("--model", default="./model/best.pt")
+    parser.add_argument("--backend", choices=["torch", "onnx", "openvino", "int8", "auto"], default=None,
+                        help="inference backend, defaults to $MODEL_BACKEND or torch")
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=1, help="number of processes, each with its own model")
+    parser.add_argument("--every", type=int, default=1, help="only detect every k-th video frame")
+    parser.add_argument("--diff-threshold", type=float, default=None, help="only detect video frames that changed this much")
+    parser.add_argument("--tile-size", type=int, default=None, help="run tiled inference with tiles of this size")
+    parser.add_argument("--prepass-imgsz", type=int, default=None, help="only tile regions found by a pre-pass at this size")
+    parser.add_argument("--log-format", choices=["json", "jsonl", "parquet"], default="json",
+                        help="video detections as one JSON document, or a per-box JSON Lines or Parquet log")
+    parser.add_argument("--no-video", action="store_true", help="only write detections, skip the annotated video")
+    parser.add_argument("--highlights", action="store_true", help="also save a short clip around detections in each video")
+    parser.add_argument("--track", action="store_true", help="track fires across video frames and report each track")
+    parser.add_argument("--skip-stable", type=int, default=1,
+                        help="with --track, only detect every k-th frame while tracks are stable")
+    parser.add_argument("--profile", metavar="DIR", default=None,
+                        help="write a cProfile .prof file per video into DIR")
+    args = parser.parse_args()
+
+    if args.backend:
+        os.environ["MODEL_BACKEND"] = args.backend
+    if args.profile:
+        # Read by the spawned workers as well
+        os.environ["PROFILE_DIR"] = args.profile
+
+    files = collect_files(args.inputs)
+    if not files:
+        parser.error("no images or videos matched the inputs")
+
+    os.makedirs(args.output, exist_ok=True)
+    stems = output_stems(args.output, files)
+    for stem in stems.values():
+        os.makedirs(os.path.dirname(stem), exist_ok=True)
+    options = {
+        "conf": args.conf,
+        "iou": args.iou,
+        "batch_size": args.batch_size,
+        "every": args.every,
+        "diff_threshold": args.diff_threshold,
+        "log_format": args.log_format,
+        "no_video": args.no_video,
+        "highlights": args.highlights,
+        "track": args.track,
+        "skip_stable": args.skip_stable,
+        "tiler": None,
+    }
+    if args.tile_size:
+        options["tiler"] = Tiler(tile_size=args.tile_size, batch_size=args.batch_size, prepass_imgsz=args.prepass_imgsz)
+
+    # Images are grouped into batches; each video is one task
+    images = [path for path, _ in files if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS]
+    videos = [path for path, _ in files if os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS]
+    tasks = [
+        (detect_images, batch, {path: stems[path] for path in batch})
+        for batch in (images[i:i + args.batch_size] for i in range(0, len(images), args.batch_size))
+    ]
+    tasks += [(detect_video, video, stems[video]) for video in videos]
+
+    done = 0
+    total = DetectionSummary()
+    with make_pool(args.model, args.workers) as pool:
+        futures = {pool.submit(fn, arg, out, options): arg for fn, arg, out in tasks}
+        for future in as_completed(futures):
+            try:
+                paths, summary = future.result()
+            except Exception as e:
+                print(f"Failed on {futures[future]}: {e}")
+                continue
+            done += len(paths)
+            total.merge(summary)
+            print(f"[{done}/{len(files)}] done")
+
+    # Per-class statistics over every image and video frame of the run
+    write_json(os.path.join(args.output, "summary.json"), total.to_dict())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from tempfile import TemporaryDirectory
+
+import cv2
+import numpy as np
+
+import storage
+from backends import available_backends
+from detection import (
+    annotate,
+    count_frames,
+    load_model,
+    make_pool,
+    open_video,
+    pipeline_by_default,
+    predict_batch,
+    predict_image,
+    process_video,
+    process_video_task,
+    resolve_model,
+    usable_cores,
+)
+from fetch import decode_image
+
+# Per-frame stages reported by the suite, in pipeline order
+STAGES = ("decode", "preprocess", "inference", "postprocess", "plot", "encode")
+
+
+def time_video(model, video_path, output_path, args, pipelined):
+    start = time.perf_counter()
+    process_video(
+        model, video_path, output_path, args.conf, args.iou,
+        batch_size=args.batch_size, pipelined=pipelined,
+    )
+    return time.perf_counter() - start
+
+
+def download_peak_memory(video_path, directory, streamed):
+    # Peak Python allocations while handing a processed video back to the
+    # user: read() into st.download_button vs the streaming file server
+    tracemalloc.start()
+    if streamed:
+        server = storage.start_download_server(directory, 0)
+        path = os.path.join(directory, os.path.basename(video_path))
+        shutil.copyfile(video_path, path)
+        url = storage.download_url(f"http://127.0.0.1:{server.server_port}", directory, path)
+        with urllib.request.urlopen(url) as response:
+            while response.read(64 * 1024):
+                pass
+        server.shutdown()
+        server.server_close()
+        os.unlink(path)
+    else:
+        with open(video_path, "rb") as f:
+            data = f.read()
+        del data
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def job_peak_rss(*args):
+    # Runs in a fresh worker process so its peak RSS covers exactly one job
+    process_video_task(*args)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def report_memory(args, videos, tmp):
+    for video_path in videos:
+        read_peak = download_peak_memory(video_path, tmp, streamed=False)
+        streamed_peak = download_peak_memory(video_path, tmp, streamed=True)
+
+        with make_pool(args.model, 1) as pool:
+            output_path = os.path.join(tmp, "out.mp4")
+            rss = pool.submit(job_peak_rss, video_path, output_path, args.conf, args.iou, args.batch_size).result()
+
+        mb = 1024 * 1024
+        print(
+            f"{os.path.basename(video_path)}: {os.path.getsize(video_path) / mb:.1f} MB, "
+            f"download peak read() {read_peak / mb:.1f} MB vs streamed {streamed_peak / mb:.1f} MB, "
+            f"job peak RSS {rss / mb:.0f} MB"
+        )
+
+
+def percentiles(values):
+    # p50/p95/mean in ms of a list of per-item timings
+    if not values:
+        return None
+    values = np.asarray(values, dtype=float)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "mean": round(float(values.mean()), 3),
+        "n": int(values.size),
+    }
+
+
+def bench_images(model, paths, batch_size, conf_threshold, iou_threshold, repeats):
+    # predict_image end to end as the Home page calls it, then the same
+    # images in batches with a per-stage breakdown from ultralytics' timings
+    end_to_end = []
+    for _ in range(repeats):
+        for path in paths:
+            with open(path, "rb") as f:
+                data = f.read()
+            start = time.perf_counter()
+            predict_image(model, decode_image(data), conf_threshold, iou_threshold)
+            end_to_end.append((time.perf_counter() - start) * 1000)
+
+    frames = [frame for frame in map(cv2.imread, paths) if frame is not None]
+    items = frames * repeats
+    stages = {stage: [] for stage in ("preprocess", "inference", "postprocess", "plot")}
+    start = time.perf_counter()
+    for i in range(0, len(items), batch_size):
+        for r in predict_batch(model, items[i:i + batch_size], conf_threshold, iou_threshold):
+            for stage in ("preprocess", "inference", "postprocess"):
+                stages[stage].append(r.speed[stage])
+            # The frames are reused across repeats, so draw on a copy
+            frame = r.orig_img.copy()
+            plot_start = time.perf_counter()
+            annotate(frame, r)
+            stages["plot"].append((time.perf_counter() - plot_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "images": len(frames),
+        "predict_image_ms": percentiles(end_to_end),
+        "batched_images_per_sec": round(len(items) / elapsed, 2),
+        "stages_ms": {stage: percentiles(values) for stage, values in stages.items()},
+    }
+
+
+def video_stages(model, video_path, output_path, batch_size, conf_threshold, iou_threshold):
+    # The steps of process_video run one after another with a timer around
+    # each, so every frame's time can be split by stage
+    cap, out = open_video(video_path, output_path)
+    stages = {stage: [] for stage in STAGES}
+    try:
+        while True:
+            batch = []
+            while len(batch) < batch_size:
+                start = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                stages["decode"].append((time.perf_counter() - start) * 1000)
+                batch.append(frame)
+            if not batch:
+                break
+
+            for frame, r in zip(batch, predict_batch(model, batch, conf_threshold, iou_threshold)):
+                for stage in ("preprocess", "inference", "postprocess"):
+                    stages[stage].append(r.speed[stage])
+                start = time.perf_counter()
+                annotate(frame, r)
+                stages["plot"].append((time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                out.write(frame)
+                stages["encode"].append((time.perf_counter() - start) * 1000)
+    finally:
+        cap.release()
+        out.release()
+
+    return {stage: percentiles(values) for stage, values in stages.items()}
+
+
+def bench_video(model, video_path, tmp, batch_size, conf_threshold, iou_threshold):
+    frames = count_frames(video_path)
+    output_path = os.path.join(tmp, "out.mp4")
+    start = time.perf_counter()
+    process_video(model, video_path, output_path, conf_threshold, iou_threshold, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "video": os.path.basename(video_path),
+        "frames": frames,
+        "fps": round(frames / elapsed, 2),
+        "stages_ms": video_stages(model, video_path, output_path, batch_size, conf_threshold, iou_threshold),
+    }
+
+
+def run_config(model_path, config, images, videos, conf_threshold, iou_threshold, repeats):
+    # Runs in a fresh process, so load time and peak RSS belong to this
+    # configuration alone
+    import torch
+    from ultralytics.utils import LOGGER
+
+    LOGGER.setLevel(logging.WARNING)
+    if config["threads"]:
+        torch.set_num_threads(config["threads"])
+
+    start = time.perf_counter()
+    model = load_model(model_path, config["backend"])
+    # The first call builds/fuses the model, so it counts as part of loading
+    predict_batch(model, [np.zeros((640, 640, 3), dtype=np.uint8)], conf_threshold, iou_threshold)
+    load_time = time.perf_counter() - start
+
+    result = {**config, "threads_used": torch.get_num_threads(), "model_load_s": round(load_time, 3)}
+    if images:
+        result["images"] = bench_images(model, images, config["batch_size"], conf_threshold, iou_threshold, repeats)
+    with TemporaryDirectory() as tmp:
+        result["videos"] = [
+            bench_video(model, video_path, tmp, config["batch_size"], conf_threshold, iou_threshold)
+            for video_path in videos
+        ]
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+def environment():
+    # What the numbers were measured on, so result files can be compared
+    import torch
+    import ultralytics
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "ultralytics": ultralytics.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def config_key(result):
+    return result["backend"], result["batch_size"], result["threads"]
+
+
+def compare(baseline, current):
+    # fps of every matching configuration and video, current vs baseline
+    old = {config_key(r): r for r in baseline["results"]}
+    for result in current["results"]:
+        previous = old.get(config_key(result))
+        if previous is None:
+            continue
+        name = "{} batch {} threads {}".format(*config_key(result))
+        before = {v["video"]: v["fps"] for v in previous.get("videos", [])}
+        for video in result.get("videos", []):
+            if video["video"] in before:
+                print(f"{name} {video['video']}: {before[video['video']]} -> {video['fps']} fps "
+                      f"({video['fps'] / before[video['video']]:.2f}x)")
+        if "images" in result and "images" in previous:
+            print(f"{name} images: {previous['images']['batched_images_per_sec']} -> "
+                  f"{result['images']['batched_images_per_sec']} images/s")
+
+
+def run_suite(args):
+    images = sorted(glob(args.images))
+    videos = sorted(glob(args.videos))
+    backends = args.backends.split(",") if args.backends else ["torch"]
+    missing = set(backends) - set(available_backends(args.model))
+    if missing:
+        raise SystemExit(f"backends not available here: {', '.join(sorted(missing))}")
+
+    # Export in this process once, not in every configuration
+    for backend in backends:
+        resolve_model(args.model, backend)
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for backend in backends:
+        for batch_size in map(int, args.batch_sizes.split(",")):
+            for threads in map(int, args.threads.split(",")):
+                config = {"backend": backend, "batch_size": batch_size, "threads": threads}
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(
+                        run_config, args.model, config, images, videos, args.conf, args.iou, args.repeats,
+                    ).result()
+                results.append(result)
+                fps = ", ".join(f"{v['video']} {v['fps']} fps" for v in result["videos"])
+                print(f"{backend} batch {batch_size} threads {threads or 'default'}: "
+                      f"load {result['model_load_s']} s, peak RSS {result['peak_rss_mb']} MB, {fps}")
+
+    report = {"environment": environment(), "model": args.model, "results": results}
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark video detection throughput")
+    parser.add_argument("--model", default="./model/best.pt")
+    parser.add_argument("--videos", default="test videos/test*.mp4")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--memory", action="store_true", help="report download and per-job peak memory instead")
+    parser.add_argument("--suite", action="store_true",
+                        help="run the full image and video suite over every configuration and write JSON results")
+    parser.add_argument("--images", default="test videos/img*", help="images for the suite")
+    parser.add_argument("--backends", default=None, help="comma-separated backends for the suite, default torch")
+    parser.add_argument("--batch-sizes", default="1,8", help="comma-separated batch sizes for the suite")
+    parser.add_argument("--threads", default="0", help="comma-separated torch thread counts for the suite, 0 = default")
+    parser.add_argument("--repeats", type=int, default=5, help="passes over the images in the suite")
+    parser.add_argument("--output", default=f"benchmarks/{time.strftime('%Y%m%d-%H%M%S')}.json",
+                        help="where the suite writes its results")
+    parser.add_argument("--compare", default=None, help="earlier suite results to compare against")
+    args = parser.parse_args()
+
+    if args.suite:
+        run_suite(args)
+        return
+
+    videos = sorted(glob(args.videos))
+
+    if args.memory:
+        with TemporaryDirectory() as tmp:
+            report_memory(args, videos, tmp)
+        return
+
+    model = load_model(args.model)
+
+    with TemporaryDirectory() as tmp:
+        # Warm up once so the first timed run doesn't pay model fusing/allocation
+        process_video(model, videos[0], os.path.join(tmp, "warmup.mp4"), args.conf, args.iou, batch_size=1)
+
+        totals = [0.0, 0.0]
+        for video_path in videos:
+            frames = count_frames(video_path)
+            output_path = os.path.join(tmp, "out.mp4")
+
+            sequential = time_video(model, video_path, output_path, args, pipelined=False)
+            pipelined = time_video(model, video_path, output_path, args, pipelined=True)
+            totals[0] += sequential
+            totals[1] += pipelined
+
+            print(
+                f"{os.path.basename(video_path)}: {frames} frames, "
+                f"sequential {frames / sequential:.1f} fps, "
+                f"pipelined {frames / pipelined:.1f} fps, "
+                f"speedup {sequential / pipelined:.2f}x"
+            )
+
+    # process_video's default only looks at the core count; this host's
+    # numbers can pin it with VIDEO_PIPELINE
+    print(
+        f"{usable_cores()} usable cores, default {'pipelined' if pipeline_by_default() else 'sequential'}; "
+        f"overall speedup {totals[0] / totals[1]:.2f}x, so set VIDEO_PIPELINE={int(totals[1] < totals[0])}"
+    )
+
+
+if __name__ == "__main__":
+    main()
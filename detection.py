@@ -0,0 +1,588 @@
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+import metrics
+from detection_log import DetectionLog
+from detection_summary import DetectionSummary
+
+# Set in each pool worker by init_worker, so a process loads the model once
+_worker_model = None
+
+
+def resolve_model(model_path, backend=None):
+    # Path to load for the chosen inference backend ("torch", "onnx",
+    # "openvino", "int8" or "auto", default $MODEL_BACKEND), exporting .pt weights
+    # first when needed. Already-exported models are returned unchanged.
+    backend = backend or os.environ.get("MODEL_BACKEND", "torch")
+    if backend == "torch" or not model_path.endswith(".pt"):
+        return model_path
+
+    import backends
+
+    if backend == "auto":
+        backend = backends.select_backend(model_path, backends.sample_frames())
+        if backend == "torch":
+            return model_path
+    return backends.export_model(model_path, backend)
+
+
+def load_model(model_path, backend=None):
+    # ultralytics (and torch with it) takes seconds to import, so it is only
+    # imported once a model is actually needed
+    from ultralytics import YOLO
+
+    start = time.perf_counter()
+    model = YOLO(resolve_model(model_path, backend), task="detect")
+    metrics.MODEL_LOAD_SECONDS.observe(
+        time.perf_counter() - start, backend=backend or os.environ.get("MODEL_BACKEND", "torch"),
+    )
+    return model
+
+
+def warm_up(model, imgsz=640):
+    # One inference on a blank frame, so lazy initialization (CUDA context,
+    # OpenVINO compilation, first allocations) happens here rather than on
+    # the first real request
+    predict_batch(model, [np.zeros((imgsz, imgsz, 3), dtype=np.uint8)], 0.5, 0.5)
+
+
+def init_worker(model_path, threads=None):
+    global _worker_model
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+    _worker_model = load_model(model_path)
+    warm_up(_worker_model)
+
+
+def get_worker_model():
+    return _worker_model
+
+
+def make_pool(model_path, workers):
+    # Spawned rather than forked: the parent may be a threaded server with
+    # torch already loaded, which fork does not cope with
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        # Export in the parent so workers don't race to write the same file
+        initargs=(resolve_model(model_path), threads),
+    )
+
+
+def worker_ready():
+    return os.getpid()
+
+
+def start_workers(pool, workers):
+    # Spawn every worker now instead of on its first job; each one loads and
+    # warms up its model in init_worker
+    return [pool.submit(worker_ready) for _ in range(workers)]
+
+
+def predict_image(model, image, conf_threshold, iou_threshold, tiler=None):
+    # One PIL image or BGR array; returns the annotated RGB image and its
+    # DetectionSummary
+    copy = True
+    if not isinstance(image, np.ndarray):
+        # cvtColor returns a new contiguous, writable array, which the boxes
+        # can be drawn into directly
+        with metrics.timed("convert"):
+            image = cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+        copy = False
+    prediction, summary, _ = predict_images(model, [image], conf_threshold, iou_threshold, tiler, copy=copy)[0]
+    return prediction, summary
+
+
+def predict_images(model, images, conf_threshold, iou_threshold, tiler=None, copy=True):
+    # A batch of BGR arrays in one model call; returns (annotated RGB image,
+    # DetectionSummary, result) per image. The model keeps each input array as
+    # orig_img, so boxes are drawn on a copy unless copy=False hands the
+    # arrays over.
+    res = predict_batch(model, images, conf_threshold, iou_threshold, tiler=tiler)
+    metrics.FRAMES.inc(len(images), source="image")
+
+    outputs = []
+    for r in res:
+        metrics.observe_speed(r)
+        # Draw on the model's own copy of the image and flip BGR to RGB as a
+        # view instead of plot() copying it and cvtColor converting it again
+        with metrics.timed("plot"):
+            frame = r.orig_img.copy() if copy else r.orig_img
+            outputs.append((annotate(frame, r)[:, :, ::-1], DetectionSummary.of(r), r))
+    return outputs
+
+
+def annotate(frame, r):
+    # Draw the boxes of r onto a BGR frame in place and return it. Looks the
+    # same as r.plot(), which copies the frame and indexes tensors per box.
+    from ultralytics.utils.plotting import Annotator, colors
+
+    names = r.names
+    annotator = Annotator(frame, example=names)
+    ids = r.boxes.id.tolist() if r.boxes.is_track else [None] * len(r.boxes)
+    boxes = zip(r.boxes.cls.tolist(), r.boxes.conf.tolist(), r.boxes.xyxy.tolist(), ids)
+    for c, conf, box, track_id in reversed(list(boxes)):
+        label = f"{names[int(c)]} {conf:.2f}" if track_id is None else f"id:{int(track_id)} {names[int(c)]} {conf:.2f}"
+        annotator.box_label(box, label, color=colors(int(c), True))
+    return annotator.result()
+
+
+def box_iou(a, b):
+    # Pairwise IoU between two (N, 4) and (M, 4) arrays of xyxy boxes
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:4], b[None, :, 2:4])
+    inter = np.clip(br - tl, 0, None).prod(2)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None] - inter + 1e-9)
+
+
+def result_to_dict(r):
+    # JSON-friendly list of the boxes in one result, with track ids if tracked
+    names = r.names
+    detections = [
+        {"class": names[int(c)], "confidence": round(conf, 4), "box": [round(v, 1) for v in box]}
+        for c, conf, box in zip(r.boxes.cls.tolist(), r.boxes.conf.tolist(), r.boxes.xyxy.tolist())
+    ]
+    if r.boxes.is_track:
+        for detection, track_id in zip(detections, r.boxes.id.tolist()):
+            detection["track"] = int(track_id)
+    return detections
+
+
+def predict_batch(model, frames, conf_threshold, iou_threshold, imgsz=640, tiler=None):
+    # Run a whole list of frames through the model in a single predict call,
+    # or through the tiler for sliced inference on high-resolution frames
+    if tiler is not None:
+        return tiler.predict(model, frames, conf_threshold, iou_threshold)
+
+    # imgsz is always passed: the predictor keeps per-call overrides, so a
+    # tile or pre-pass size would otherwise stick to the shared model
+    return model.predict(
+        frames,
+        conf=conf_threshold,
+        iou=iou_threshold,
+        imgsz=imgsz,
+        device="cpu",
+        verbose=False,
+    )
+
+
+def count_frames(video_path):
+    cap = cv2.VideoCapture(video_path)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return frames
+
+
+def video_fps(video_path):
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return fps
+
+
+def open_video(video_path, output_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video {video_path}")
+
+    # No output path: detections only, nothing is rendered or encoded
+    if output_path is None:
+        return cap, None
+
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    return cap, open_writer(output_path, fps, (frame_width, frame_height))
+
+
+def open_writer(output_path, fps, size):
+    fourcc = cv2.VideoWriter_fourcc(*"XVID")
+    return cv2.VideoWriter(output_path, fourcc, fps, size)
+
+
+class HighlightRecorder:
+    # Encodes only the footage around detections: up to before seconds of
+    # lead-in from a ring buffer, then every frame until after seconds past
+    # the last frame with a box at or above min_conf. The clip is opened on
+    # the first detection, so a quiet video is never encoded at all. The
+    # lead-in holds raw frames, so keep before short for large videos.
+    def __init__(self, output_path, fps, before=1.0, after=2.0, min_conf=0.5, classes=None):
+        self.output_path = output_path
+        self.fps = fps or 30
+        self.buffer = deque(maxlen=max(1, int(before * self.fps)))
+        self.after = int(after * self.fps)
+        self.min_conf = min_conf
+        self.classes = {c.lower() for c in classes} if classes else None
+        self.out = None
+        self.last = None
+        self.until = -1
+        self.segments = []
+
+    def is_event(self, r):
+        names = r.names
+        return any(
+            conf >= self.min_conf and (self.classes is None or names[int(c)].lower() in self.classes)
+            for c, conf in zip(r.boxes.cls.tolist(), r.boxes.conf.tolist())
+        )
+
+    def add(self, index, frame, r, drawn=False):
+        # r is None for frames the sampler skipped; their boxes are carried
+        # forward. drawn=True means the frame was already annotated.
+        if r is not None:
+            self.last = r
+        boxes = None if drawn else self.last
+
+        if r is not None and self.is_event(r):
+            if index > self.until:
+                self.segments.append([self.buffer[0][0] if self.buffer else index, index])
+            self.until = index + self.after
+
+        if index > self.until:
+            self.buffer.append((index, frame, boxes))
+            return
+
+        while self.buffer:
+            self._write(*self.buffer.popleft()[1:])
+        self._write(frame, boxes)
+        self.segments[-1][1] = index
+
+    def _write(self, frame, boxes):
+        if self.out is None:
+            height, width = frame.shape[:2]
+            self.out = open_writer(self.output_path, self.fps, (width, height))
+        self.out.write(annotate(frame, boxes) if boxes is not None else frame)
+
+    def timestamps(self):
+        # (start, end) seconds of every highlight in the source video
+        return [(round(start / self.fps, 3), round(end / self.fps, 3)) for start, end in self.segments]
+
+    def close(self):
+        self.buffer.clear()
+        if self.out is not None:
+            self.out.release()
+            self.out = None
+
+
+class FrameSampler:
+    # Decides which frames go through the model. With every=k only every k-th
+    # frame is detected; with diff_threshold set, a frame is detected when it
+    # differs enough from the last detected one, or after max_skip frames so
+    # alert latency stays bounded.
+    def __init__(self, every=1, diff_threshold=None, max_skip=30, thumb_size=(64, 36)):
+        self.every = max(1, int(every))
+        self.diff_threshold = diff_threshold
+        self.max_skip = max(1, int(max_skip))
+        self.thumb_size = thumb_size
+        self.index = 0
+        self.since_detect = 0
+        self.last_thumb = None
+
+    def frame_difference(self, frame):
+        # Mean absolute difference of tiny grayscale thumbnails, in [0, 1]
+        thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), self.thumb_size, interpolation=cv2.INTER_AREA)
+        if self.last_thumb is None:
+            return 1.0, thumb
+        return float(cv2.absdiff(thumb, self.last_thumb).mean()) / 255, thumb
+
+    def should_detect(self, frame):
+        if self.diff_threshold is None:
+            detect = self.index % self.every == 0
+        else:
+            score, thumb = self.frame_difference(frame)
+            detect = score >= self.diff_threshold or self.since_detect + 1 >= self.max_skip
+            if detect:
+                self.last_thumb = thumb
+
+        self.index += 1
+        self.since_detect = 0 if detect else self.since_detect + 1
+        return detect
+
+
+def read_batches(cap, batch_size, sampler=None):
+    # Yield lists of (index, frame, detect) items, in order, holding up to batch_size
+    # frames to detect. Skipped frames ride along so they can be annotated with
+    # the previous boxes, capped so a sparse sampler doesn't buffer too much.
+    items = []
+    to_detect = 0
+    max_pending = batch_size * 4
+    index = 0
+
+    while cap.isOpened():
+        with metrics.timed("decode"):
+            ret, frame = cap.read()
+        if not ret:
+            break
+
+        detect = sampler is None or sampler.should_detect(frame)
+        items.append((index, frame, detect))
+        index += 1
+        to_detect += detect
+
+        if to_detect == batch_size or len(items) >= max_pending:
+            yield items
+            items = []
+            to_detect = 0
+
+    if items:
+        yield items
+
+
+def detect_items(model, items, conf_threshold, iou_threshold, tiler=None, tracker=None):
+    # Pair every frame with its own result, or None if it was skipped. With a
+    # tracker, results are replaced by its confirmed tracks, in frame order.
+    frames = [frame for _, frame, detect in items if detect]
+    res = iter(predict_batch(model, frames, conf_threshold, iou_threshold, tiler=tiler) if frames else ())
+    items = [(index, frame, next(res) if detect else None) for index, frame, detect in items]
+    for _, _, r in items:
+        if r is not None:
+            metrics.observe_speed(r)
+    metrics.FRAMES.inc(len(frames), source="video")
+    if tracker is None:
+        return items
+    return [(index, frame, tracker.update(index, r) if r is not None else None) for index, frame, r in items]
+
+
+def write_results(out, items, last=None, on_result=None, highlight=None):
+    # Boxes are drawn straight onto the decoded BGR frame, so it goes to the
+    # writer without a copy or colour conversion. Skipped frames get the
+    # boxes of the last detected frame. Without a writer nothing is drawn
+    # except for frames the highlight recorder keeps.
+    for index, frame, r in items:
+        if r is not None:
+            last = r
+            if on_result is not None:
+                on_result(index, r)
+
+        if out is not None:
+            if last is not None:
+                with metrics.timed("plot"):
+                    frame = annotate(frame, last)
+            with metrics.timed("encode"):
+                out.write(frame)
+        if highlight is not None:
+            highlight.add(index, frame, r, drawn=out is not None)
+
+    return last
+
+
+def _put(q, item, stop, name=None):
+    # Blocking put that gives up once another stage has failed; name reports
+    # the queue's depth as a metric
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            if name:
+                metrics.QUEUE_DEPTH.set(q.qsize(), queue=name)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop, name=None):
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.1)
+            if name:
+                metrics.QUEUE_DEPTH.set(q.qsize(), queue=name)
+            return item
+        except queue.Empty:
+            continue
+    return None
+
+
+def _decode_stage(cap, batch_size, sampler, frame_queue, stop, errors):
+    try:
+        for items in read_batches(cap, batch_size, sampler):
+            if not _put(frame_queue, items, stop, "frames"):
+                return
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put(frame_queue, None, stop)
+
+
+def _encode_stage(out, result_queue, on_result, highlight, stop, errors):
+    last = None
+    try:
+        while True:
+            items = _get(result_queue, stop, "results")
+            if items is None:
+                return
+            last = write_results(out, items, last, on_result, highlight)
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+
+
+def usable_cores():
+    # Cores this process may run on, which can be fewer than the machine has
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def pipeline_by_default():
+    # $VIDEO_PIPELINE=1/0 forces the choice, e.g. after benchmark.py compared
+    # both modes on the host. Otherwise pipelining needs a spare core: on a
+    # single core the decode and encode threads only take turns with
+    # inference, and benchmark.py put it anywhere from 0.87x to 1.19x of the
+    # sequential path there, so that host stays sequential.
+    forced = os.environ.get("VIDEO_PIPELINE")
+    if forced:
+        return forced == "1"
+    return usable_cores() > 1
+
+
+def process_video(model, video_path, output_path, conf_threshold, iou_threshold,
+                  batch_size=8, queue_size=4, pipelined=None, sampler=None, on_result=None, tiler=None,
+                  highlight=None, tracker=None):
+    # pipelined=None picks the mode with pipeline_by_default().
+    # on_result(frame_index, result) is called, in frame order, for every
+    # frame that went through the model. With output_path=None no annotated
+    # video is written, so frames are never drawn or encoded; a
+    # HighlightRecorder can still keep the footage around detections. A
+    # tracker replaces raw boxes with tracks, so the model also has to
+    # return the low-confidence boxes it uses to keep tracks alive.
+    cap, out = open_video(video_path, output_path)
+    batch_size = max(1, int(batch_size))
+    if tracker is not None:
+        conf_threshold = min(conf_threshold, tracker.low_thresh)
+    if pipelined is None:
+        pipelined = pipeline_by_default()
+    start = time.perf_counter()
+
+    try:
+        if not pipelined:
+            last = None
+            for items in read_batches(cap, batch_size, sampler):
+                items = detect_items(model, items, conf_threshold, iou_threshold, tiler, tracker)
+                last = write_results(out, items, last, on_result, highlight)
+            return
+
+        # decode -> detect -> annotate/encode, connected by bounded queues so
+        # OpenCV I/O overlaps with inference without buffering the whole video
+        frame_queue = queue.Queue(maxsize=queue_size)
+        result_queue = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        errors = []
+
+        # Named after their stage so profilers and py-spy dumps are readable
+        decoder = threading.Thread(
+            name="decode",
+            target=_decode_stage,
+            args=(cap, batch_size, sampler, frame_queue, stop, errors),
+            daemon=True,
+        )
+        encoder = threading.Thread(
+            name="encode",
+            target=_encode_stage,
+            args=(out, result_queue, on_result, highlight, stop, errors),
+            daemon=True,
+        )
+        decoder.start()
+        encoder.start()
+
+        try:
+            while True:
+                items = _get(frame_queue, stop, "frames")
+                if items is None:
+                    break
+
+                items = detect_items(model, items, conf_threshold, iou_threshold, tiler, tracker)
+                if not _put(result_queue, items, stop, "results"):
+                    break
+        except Exception:
+            stop.set()
+            raise
+        finally:
+            _put(result_queue, None, stop)
+            decoder.join()
+            encoder.join()
+
+        if errors:
+            raise errors[0]
+    finally:
+        frames = cap.get(cv2.CAP_PROP_POS_FRAMES)
+        if frames:
+            metrics.FPS.set(round(frames / (time.perf_counter() - start), 2), source="video")
+        cap.release()
+        if out is not None:
+            out.release()
+        if highlight is not None:
+            highlight.close()
+
+
+def process_video_task(video_path, output_path, conf_threshold, iou_threshold,
+                       batch_size=8, sampler=None, progress=None, key=None, tiler=None,
+                       monitor=None, location=None, log_path=None, highlight_path=None,
+                       tracker=None, tracks_path=None, shared_metrics=None, summary_path=None):
+    # Pool entry point: runs a whole video on this worker's model and reports
+    # the fraction of frames done into the shared progress mapping, and this
+    # worker's metrics into shared_metrics about once a second. With a
+    # monitor, sustained detections raise alert events for location; with
+    # log_path, detections are written to a JSON Lines or Parquet log; with
+    # highlight_path, the footage around detections is saved as a clip; with
+    # a tracker, its per-track summary is written as JSON to tracks_path;
+    # with summary_path, per-class statistics of the whole video are.
+    total = max(1, count_frames(video_path))
+    fps = video_fps(video_path)
+    observe = monitor.callback(location or os.path.basename(video_path), fps) if monitor else None
+    log = DetectionLog(log_path, fps) if log_path else None
+    highlight = HighlightRecorder(highlight_path, fps, min_conf=conf_threshold) if highlight_path else None
+    summary = DetectionSummary() if summary_path else None
+    published = [time.monotonic()]
+
+    def on_result(index, r):
+        if progress is not None:
+            progress[key] = min(1.0, (index + 1) / total)
+        if observe is not None:
+            observe(index, r)
+        if log is not None:
+            log.write(index, r)
+        if summary is not None:
+            summary.add(r)
+        if shared_metrics is not None and time.monotonic() - published[0] >= 1.0:
+            metrics.publish(shared_metrics)
+            published[0] = time.monotonic()
+
+    try:
+        with metrics.profiled("video-job"):
+            process_video(
+                get_worker_model(), video_path, output_path, conf_threshold, iou_threshold,
+                batch_size=batch_size, sampler=sampler, on_result=on_result, tiler=tiler, highlight=highlight,
+                tracker=tracker,
+            )
+    finally:
+        if log is not None:
+            log.close()
+        if shared_metrics is not None:
+            metrics.publish(shared_metrics)
+    if tracker is not None and tracks_path:
+        with open(tracks_path, "w") as f:
+            json.dump({"source": os.path.basename(video_path), "tracks": tracker.summary(fps)}, f, indent=2)
+    if summary is not None:
+        with open(summary_path, "w") as f:
+            json.dump({"source": os.path.basename(video_path), **summary.to_dict()}, f, indent=2)
+    if progress is not None:
+        progress[key] = 1.0
+
+    return output_path
@@ -0,0 +1,104 @@
+import json
+import os
+
+
+def log_format(path):
+    # Format from the file extension: .parquet, anything else is JSON Lines
+    return "parquet" if path.endswith(".parquet") else "jsonl"
+
+
+def result_rows(index, timestamp, r):
+    # One flat row per box, so frames without detections produce no rows;
+    # track is the tracker's id for the box, or None without tracking
+    names = r.names
+    ids = r.boxes.id.tolist() if r.boxes.is_track else [None] * len(r.boxes)
+    return [
+        {
+            "frame": index,
+            "timestamp": timestamp,
+            "class": names[int(c)],
+            "confidence": round(conf, 4),
+            "x1": round(box[0], 1),
+            "y1": round(box[1], 1),
+            "x2": round(box[2], 1),
+            "y2": round(box[3], 1),
+            "track": None if track_id is None else int(track_id),
+        }
+        for c, conf, box, track_id in zip(r.boxes.cls.tolist(), r.boxes.conf.tolist(), r.boxes.xyxy.tolist(), ids)
+    ]
+
+
+class DetectionLog:
+    # Columnar per-frame detection log, written while the video is processed
+    # rather than collected in memory. JSON Lines rows go through the file's
+    # write buffer and are flushed on flush() or close(); Parquet rows are
+    # buffered into row groups of row_group_size.
+    # Pass write as process_video's on_result.
+    def __init__(self, path, fps=None, row_group_size=10000):
+        self.path = path
+        self.format = log_format(path)
+        self.fps = fps or 30
+        self.row_group_size = row_group_size
+        self.rows = []
+        self.frames = 0
+        self.detections = 0
+
+        if self.format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            self.schema = pa.schema([
+                ("frame", pa.int64()), ("timestamp", pa.float64()), ("class", pa.string()),
+                ("confidence", pa.float32()), ("x1", pa.float32()), ("y1", pa.float32()),
+                ("x2", pa.float32()), ("y2", pa.float32()), ("track", pa.int64()),
+            ])
+            self.file = pq.ParquetWriter(path, self.schema)
+        else:
+            self.file = open(path, "w")
+
+    def write(self, index, r):
+        rows = result_rows(index, round(index / self.fps, 3), r)
+        self.frames += 1
+        self.detections += len(rows)
+
+        if self.format == "parquet":
+            self.rows.extend(rows)
+            if len(self.rows) >= self.row_group_size:
+                self.flush()
+        else:
+            for row in rows:
+                self.file.write(json.dumps(row) + "\n")
+
+    def flush(self):
+        if self.format == "parquet":
+            if self.rows:
+                import pyarrow as pa
+
+                self.file.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+                self.rows = []
+        else:
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_log(path):
+    # Rows of a log as a list of dicts, for quick inspection; use pandas or
+    # pyarrow directly on the file for anything bigger
+    if log_format(path) == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path).to_pylist()
+
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,225 @@
+import numpy as np
+
+from detection_log import log_format, read_log
+
+# Boxes from update() are buffered and folded in this many rows at a time
+FLUSH_ROWS = 4096
+
+
+class ClassSummary:
+    def __init__(self, name, count, max_conf, mean_conf, min_area, mean_area, max_area):
+        self.name = name
+        self.count = count
+        self.max_conf = max_conf
+        self.mean_conf = mean_conf
+        self.min_area = min_area
+        self.mean_area = mean_area
+        self.max_area = max_area
+
+    def to_dict(self):
+        return {
+            "class": self.name,
+            "count": self.count,
+            "max_conf": round(self.max_conf, 4),
+            "mean_conf": round(self.mean_conf, 4),
+            "min_area": round(self.min_area, 1),
+            "mean_area": round(self.mean_area, 1),
+            "max_area": round(self.max_area, 1),
+        }
+
+
+class DetectionSummary:
+    # Per-class box statistics over any number of results: one image, a
+    # batch, a whole video or a detection log. Each add is a few bincount
+    # and ufunc.at calls over all boxes at once, never a Python loop per
+    # box, and summaries of separate batches, videos or processes combine
+    # with merge. Boxes of single frames are buffered, so feeding a video
+    # frame by frame still does the statistics in large batches. Class ids
+    # index the arrays; names maps them to labels.
+    def __init__(self, names=None):
+        self.names = dict(names or {})
+        self.frames = 0
+        self.frames_with_detections = 0
+        self.speed_ms = 0.0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.conf_sum = np.zeros(0)
+        self.conf_max = np.zeros(0)
+        self.area_sum = np.zeros(0)
+        self.area_min = np.zeros(0)
+        self.area_max = np.zeros(0)
+        self.pending = []
+        self.pending_rows = 0
+
+    @classmethod
+    def of(cls, results):
+        summary = cls()
+        summary.update(results if isinstance(results, (list, tuple)) else [results])
+        return summary
+
+    def _grow(self, size):
+        extra = size - len(self.counts)
+        if extra <= 0:
+            return
+        self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=np.int64)])
+        self.conf_sum = np.concatenate([self.conf_sum, np.zeros(extra)])
+        self.conf_max = np.concatenate([self.conf_max, np.zeros(extra)])
+        self.area_sum = np.concatenate([self.area_sum, np.zeros(extra)])
+        self.area_min = np.concatenate([self.area_min, np.full(extra, np.inf)])
+        self.area_max = np.concatenate([self.area_max, np.zeros(extra)])
+
+    def update(self, results):
+        for r in results:
+            self.names.update(r.names)
+            self.speed_ms += sum(value for value in r.speed.values() if value is not None)
+            self.frames += 1
+            if len(r.boxes):
+                self.frames_with_detections += 1
+                # Only the small box array is kept, never the frame
+                self.pending.append(r.boxes.data.cpu().numpy())
+                self.pending_rows += len(r.boxes)
+        if self.pending_rows >= FLUSH_ROWS:
+            self.flush()
+        return self
+
+    def flush(self):
+        if self.pending:
+            data = np.concatenate(self.pending)
+            self.pending = []
+            self.pending_rows = 0
+            self.add_boxes(data[:, -1], data[:, -2], data[:, :4])
+
+    def add(self, r):
+        return self.update([r])
+
+    def add_boxes(self, classes, confs, boxes):
+        # Raw columns: class ids, confidences and xyxy boxes, e.g. from a log
+        classes = np.asarray(classes).astype(np.int64)
+        if not classes.size:
+            return self
+        confs = np.asarray(confs, dtype=np.float64)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+        size = max(len(self.counts), int(classes.max()) + 1)
+        self._grow(size)
+        self.counts += np.bincount(classes, minlength=size)
+        self.conf_sum += np.bincount(classes, weights=confs, minlength=size)
+        self.area_sum += np.bincount(classes, weights=areas, minlength=size)
+        np.maximum.at(self.conf_max, classes, confs)
+        np.minimum.at(self.area_min, classes, areas)
+        np.maximum.at(self.area_max, classes, areas)
+        return self
+
+    def _class_ids(self, names):
+        # This summary's ids for another summary's {id: name}, adding new names
+        by_name = {name: i for i, name in self.names.items()}
+        ids = {}
+        for i, name in names.items():
+            if name not in by_name:
+                by_name[name] = max(list(self.names) + [len(self.counts) - 1, -1]) + 1
+                self.names[by_name[name]] = name
+            ids[i] = by_name[name]
+        return ids
+
+    def merge(self, other):
+        # Classes are matched by name, so summaries with different id orders
+        # (or built from logs) still add up
+        self.flush()
+        other.flush()
+        self.frames += other.frames
+        self.frames_with_detections += other.frames_with_detections
+        self.speed_ms += other.speed_ms
+        if not len(other.counts):
+            return self
+
+        names = {i: other.names.get(i, str(i)) for i in range(len(other.counts))}
+        ids = self._class_ids(names)
+        target = np.array([ids[i] for i in range(len(other.counts))], dtype=np.int64)
+        self._grow(int(target.max()) + 1)
+        np.add.at(self.counts, target, other.counts)
+        np.add.at(self.conf_sum, target, other.conf_sum)
+        np.add.at(self.area_sum, target, other.area_sum)
+        np.maximum.at(self.conf_max, target, other.conf_max)
+        np.minimum.at(self.area_min, target, other.area_min)
+        np.maximum.at(self.area_max, target, other.area_max)
+        return self
+
+    @property
+    def detections(self):
+        self.flush()
+        return int(self.counts.sum())
+
+    def class_counts(self):
+        # {name: count} for every class that was seen, most frequent first
+        return {c.name: c.count for c in self.classes()}
+
+    def classes(self):
+        # ClassSummary for every class that was seen, most frequent first
+        self.flush()
+        seen = np.flatnonzero(self.counts)
+        seen = seen[np.argsort(-self.counts[seen], kind="stable")]
+        counts = self.counts[seen]
+        mean_conf = self.conf_sum[seen] / counts
+        mean_area = self.area_sum[seen] / counts
+        return [
+            ClassSummary(self.names.get(int(i), str(int(i))), int(n), float(max_conf), float(conf), float(min_area),
+                         float(area), float(max_area))
+            for i, n, max_conf, conf, min_area, area, max_area in zip(
+                seen, counts, self.conf_max[seen], mean_conf, self.area_min[seen], mean_area, self.area_max[seen],
+            )
+        ]
+
+    def text(self):
+        # "Predicted 2 fires, 1 smoke in 0.12 seconds."
+        parts = [f"{c.count} {c.name}" + ("s" if c.count > 1 else "") for c in self.classes()]
+        text = f"Predicted {', '.join(parts)}" if parts else "No objects detected"
+        return f"{text} in {round(self.speed_ms / 1000, 2)} seconds."
+
+    def to_dict(self):
+        return {
+            "frames": self.frames,
+            "frames_with_detections": self.frames_with_detections,
+            "detections": self.detections,
+            "speed_ms": round(self.speed_ms, 1),
+            "classes": [c.to_dict() for c in self.classes()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        # Inverse of to_dict, so stored summaries can be merged again; sums
+        # are rebuilt from the rounded means
+        summary = cls({i: c["class"] for i, c in enumerate(data["classes"])})
+        summary.frames = data["frames"]
+        summary.frames_with_detections = data["frames_with_detections"]
+        summary.speed_ms = data["speed_ms"]
+        summary._grow(len(data["classes"]))
+        for i, c in enumerate(data["classes"]):
+            summary.counts[i] = c["count"]
+            summary.conf_sum[i] = c["mean_conf"] * c["count"]
+            summary.conf_max[i] = c["max_conf"]
+            summary.area_sum[i] = c["mean_area"] * c["count"]
+            summary.area_min[i] = c["min_area"]
+            summary.area_max[i] = c["max_area"]
+        return summary
+
+    @classmethod
+    def from_log(cls, path):
+        # Summary of a detection log, read column by column; frames without
+        # detections are not in a log, so frames counts the frames with any
+        if log_format(path) == "parquet":
+            import pyarrow.parquet as pq
+
+            table = pq.read_table(path, columns=["frame", "class", "confidence", "x1", "y1", "x2", "y2"])
+            columns = {name: table.column(name).to_numpy() for name in table.column_names}
+        else:
+            rows = read_log(path)
+            columns = {
+                name: np.array([row[name] for row in rows])
+                for name in ("frame", "class", "confidence", "x1", "y1", "x2", "y2")
+            }
+
+        names, classes = np.unique(columns["class"].astype(str), return_inverse=True)
+        summary = cls(dict(enumerate(names.tolist())))
+        summary.frames = summary.frames_with_detections = int(np.unique(columns["frame"]).size)
+        boxes = np.stack([columns["x1"], columns["y1"], columns["x2"], columns["y2"]], axis=1)
+        return summary.add_boxes(classes, columns["confidence"], boxes)
@@ -0,0 +1,152 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from alerts import SENT, send_bulk_email
+
+logger = logging.getLogger(__name__)
+
+ALERT_SUBJECT = "❗Alert there is a fire❗"
+ALERT_MESSAGE = """A forest fire has been detected near {location}.
+Please stay safe and take necessary precautions."""
+
+
+class FireEvent:
+    def __init__(self, location, timestamp, frames, max_conf, classes, cooldown=0.0):
+        self.location = location
+        self.timestamp = timestamp
+        self.frames = frames
+        self.max_conf = max_conf
+        self.classes = classes
+        # Seconds the location should stay quiet after this event is sent
+        self.cooldown = cooldown
+        self.created = time.time()
+
+    def to_dict(self):
+        return {
+            "location": self.location,
+            "timestamp": self.timestamp,
+            "frames": self.frames,
+            "max_conf": self.max_conf,
+            "classes": self.classes,
+        }
+
+
+class DetectionMonitor:
+    # Turns per-frame detections into alert events. An event is raised for a
+    # location once at least min_frames frames within the last window seconds
+    # had a box of a watched class at or above min_conf. After that the
+    # location is quiet for cooldown seconds, so a fire that stays in view
+    # raises one event rather than one per frame. Each job and stream has its
+    # own monitor, so the cooldown also travels with the event and the
+    # AlertDispatcher enforces it across all of them.
+    def __init__(self, events, min_frames=5, min_conf=0.5, window=10.0, cooldown=600.0, classes=("fire", "smoke")):
+        self.events = events
+        self.min_frames = min_frames
+        self.min_conf = min_conf
+        self.window = window
+        self.cooldown = cooldown
+        self.classes = {c.lower() for c in classes} if classes else None
+        self.hits = {}
+        self.last_event = {}
+
+    def observe(self, location, r, timestamp=None):
+        # timestamp defaults to wall-clock time; pass video time for files
+        timestamp = time.time() if timestamp is None else timestamp
+        hits = self.hits.setdefault(location, deque())
+
+        names = r.names
+        confident = [
+            (names[int(c)], conf)
+            for c, conf in zip(r.boxes.cls.tolist(), r.boxes.conf.tolist())
+            if conf >= self.min_conf and (self.classes is None or names[int(c)].lower() in self.classes)
+        ]
+        if confident:
+            hits.append((timestamp, max(conf for _, conf in confident), {name for name, _ in confident}))
+
+        while hits and hits[0][0] < timestamp - self.window:
+            hits.popleft()
+
+        if len(hits) < self.min_frames:
+            return None
+        last = self.last_event.get(location)
+        if last is not None and timestamp - last < self.cooldown:
+            return None
+
+        event = FireEvent(
+            location, timestamp, len(hits),
+            round(max(conf for _, conf, _ in hits), 4),
+            sorted(set().union(*(classes for _, _, classes in hits))),
+            self.cooldown,
+        )
+        self.last_event[location] = timestamp
+        hits.clear()
+        self.events.put(event)
+        return event
+
+    def callback(self, location, fps):
+        # on_result hook for process_video, timed by frame index / fps
+        fps = fps or 30
+
+        def on_result(index, r):
+            self.observe(location, r, index / fps)
+
+        return on_result
+
+
+class AlertDispatcher:
+    # Consumes events from the queue on a background thread and emails every
+    # subscriber through send_bulk_email, keeping a short history for the UI
+    def __init__(self, events, recipients, subject=ALERT_SUBJECT, message=ALERT_MESSAGE, min_interval=60.0, **send_options):
+        self.events = events
+        self.recipients = recipients
+        self.subject = subject
+        self.message = message
+        self.min_interval = min_interval
+        self.send_options = send_options
+        self.history = deque(maxlen=50)
+        self.last_sent = {}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                event = self.events.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if event is None:
+                return
+            self.dispatch(event)
+
+    def dispatch(self, event):
+        # Events for one location from several monitors (jobs, streams) are
+        # sent at most once per the event's cooldown, and never more than once
+        # per min_interval
+        now = time.time()
+        last = self.last_sent.get(event.location)
+        if last is not None and now - last < max(self.min_interval, event.cooldown):
+            self.history.append((event, "suppressed"))
+            return None
+        self.last_sent[event.location] = now
+
+        try:
+            results = send_bulk_email(
+                self.recipients(), self.subject,
+                self.message.format(location=event.location), **self.send_options,
+            )
+            status = f"sent to {sum(s == SENT for s in results.values())} of {len(results)} subscribers"
+        except Exception as e:
+            logger.exception("Failed to dispatch alert for %s", event.location)
+            status = f"failed: {e}"
+        self.history.append((event, status))
+        return status
+
+    def stop(self):
+        self.events.put(None)
+        self.thread.join()
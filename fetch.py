@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import cv2
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError
+from urllib3.util.retry import Retry
+
+import metrics
+
+CHUNK_SIZE = 64 * 1024
+
+
+class FetchError(Exception):
+    pass
+
+
+def decode_image(data):
+    # BGR array straight from the encoded bytes, the layout predict_image
+    # and the tiler use, so the image is never converted a second time
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise FetchError("Not a supported image")
+    return image
+
+
+class ImageFetcher:
+    # Downloads images for the server with bounded cost. Connections are
+    # pooled, connect and read time out, the whole download must finish
+    # within max_seconds, and bodies over max_bytes are refused. Results
+    # are kept per URL with their ETag: within fresh_for seconds a rerun
+    # doesn't touch the network, after that the server is only asked
+    # whether the ETag still matches.
+    def __init__(self, max_bytes=20 * 1024 ** 2, connect_timeout=3.05, read_timeout=10.0, max_seconds=30.0,
+                 fresh_for=60.0, cache_bytes=200 * 1024 ** 2, pool_size=10):
+        self.max_bytes = max_bytes
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_seconds = max_seconds
+        self.fresh_for = fresh_for
+        self.cache_bytes = cache_bytes
+        self.session = requests.Session()
+        # Only retry failed connects; a slow read is already a timeout
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = "Extinguisher"
+        # url -> (etag, checked_at, data, image), least recently used first
+        self.cache = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def fetch(self, url):
+        # (encoded bytes, BGR array) of the image at url
+        if urlparse(url).scheme not in ("http", "https"):
+            raise FetchError("Only http and https URLs are supported")
+
+        with self.lock:
+            entry = self.cache.get(url)
+            if entry is not None:
+                self.cache.move_to_end(url)
+        if entry is not None and time.monotonic() - entry[1] < self.fresh_for:
+            return entry[2], entry[3]
+
+        headers = {"If-None-Match": entry[0]} if entry is not None and entry[0] else {}
+        with metrics.timed("fetch"):
+            try:
+                with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                    if response.status_code == 304 and entry is not None:
+                        data, image = entry[2], entry[3]
+                    else:
+                        response.raise_for_status()
+                        data = self._read(response)
+                        image = decode_image(data)
+                    etag = response.headers.get("ETag")
+            except (requests.RequestException, HTTPError) as e:
+                raise FetchError(str(e)) from e
+
+        self._store(url, (etag, time.monotonic(), data, image))
+        return data, image
+
+    def _read(self, response):
+        length = response.headers.get("Content-Length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            raise FetchError(f"Image is larger than {self.max_bytes // 1024 ** 2} MB")
+
+        # The read timeout applies per socket read, so a server trickling
+        # bytes could hold iter_content, which fills whole chunks, open
+        # forever; read1 returns whatever has arrived, so the deadline is
+        # checked at least once per read timeout
+        deadline = time.monotonic() + self.max_seconds
+        chunks = []
+        size = 0
+        while True:
+            chunk = response.raw.read1(CHUNK_SIZE, decode_content=True)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise FetchError(f"Image is larger than {self.max_bytes // 1024 ** 2} MB")
+            if time.monotonic() > deadline:
+                raise FetchError(f"Download took longer than {self.max_seconds:g}s")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _store(self, url, entry):
+        with self.lock:
+            old = self.cache.pop(url, None)
+            if old is not None:
+                self.size -= len(old[2]) + old[3].nbytes
+            self.cache[url] = entry
+            self.size += len(entry[2]) + entry[3].nbytes
+            while self.size > self.cache_bytes and len(self.cache) > 1:
+                _, old = self.cache.popitem(last=False)
+                self.size -= len(old[2]) + old[3].nbytes
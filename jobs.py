@@ -0,0 +1,257 @@
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from detection import make_pool, process_video_task, resolve_model, start_workers
+from result_cache import hash_file, link_or_copy, model_version
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, name, input_path, workdir, output_path, args, kwargs, log_path=None, highlight_path=None,
+                 tracks_path=None, summary_path=None):
+        self.id = os.path.basename(workdir)
+        self.name = name
+        self.input_path = input_path
+        self.workdir = workdir
+        self.output_path = output_path
+        self.log_path = log_path
+        self.highlight_path = highlight_path
+        self.tracks_path = tracks_path
+        self.summary_path = summary_path
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.error = None
+        self.finished_at = None
+        self.cache_key = None
+        self.cached = False
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def outputs(self):
+        # {role: path} of every output the job was asked to produce
+        paths = {
+            "output": self.output_path, "log": self.log_path,
+            "highlight": self.highlight_path, "tracks": self.tracks_path, "summary": self.summary_path,
+        }
+        return {role: path for role, path in paths.items() if path}
+
+
+class JobScheduler:
+    # Runs video jobs on one shared process pool, at most max_concurrent at a
+    # time across all sessions. Jobs wait in a FIFO queue so the UI can show
+    # each one's position, and every job writes into its own directory. With
+    # a ResultCache, a video already processed with the same model and options
+    # is served from the cache instead of being queued, unless alerts are on.
+    def __init__(self, model_path, root, max_concurrent, max_age, cache=None):
+        self.root = root
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_age = max_age
+        self.model_path = model_path = resolve_model(model_path)
+        self.pool = None
+        self._start_pool()
+        self.cache = cache
+        self.model_version = model_version(model_path) if cache is not None else None
+        self.manager = multiprocessing.Manager()
+        self.progress = self.manager.dict()
+        # Alert events raised by monitors inside the worker processes
+        self.events = self.manager.Queue()
+        # Metric snapshots published by the workers, served by /metrics
+        self.metrics = self.manager.dict()
+        metrics.add_source(self.metrics)
+        self.jobs = {}
+        self.pending = deque()
+        self.running = 0
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def submit(self, name, input_path, output_name, conf_threshold, iou_threshold, batch_size=8, sampler=None, tiler=None,
+               monitor=None, location=None, log_name=None, highlight_name=None, tracker=None, tracks_name=None,
+               summary_name=None):
+        # output_name=None skips the annotated video; log_name adds a
+        # detection log (.jsonl or .parquet), highlight_name a clip of the
+        # footage around detections, tracks_name the tracker's summary and
+        # summary_name per-class detection statistics
+        self.cleanup()
+
+        workdir = os.path.join(self.root, uuid.uuid4().hex)
+        os.makedirs(workdir)
+        output_path = os.path.join(workdir, output_name) if output_name else None
+        log_path = os.path.join(workdir, log_name) if log_name else None
+        highlight_path = os.path.join(workdir, highlight_name) if highlight_name else None
+        tracks_path = os.path.join(workdir, tracks_name) if tracker is not None and tracks_name else None
+        summary_path = os.path.join(workdir, summary_name) if summary_name else None
+        job = Job(
+            name, input_path, workdir, output_path, (conf_threshold, iou_threshold),
+            {
+                "batch_size": batch_size, "sampler": sampler, "tiler": tiler,
+                "monitor": monitor, "location": location, "log_path": log_path,
+                "highlight_path": highlight_path, "tracker": tracker, "tracks_path": tracks_path,
+                "summary_path": summary_path,
+            },
+            log_path, highlight_path, tracks_path, summary_path,
+        )
+
+        if self.cache is not None:
+            # Output names embed the upload's name, so key on their extensions only
+            formats = {role: os.path.splitext(path)[1] for role, path in job.outputs().items()}
+            job.cache_key = self.cache.key(
+                hash_file(input_path), self.model_version, conf=conf_threshold, iou=iou_threshold,
+                sampler=sampler, tiler=tiler, tracker=tracker, outputs=formats,
+            )
+            # A cache hit would skip the frames, and with them any alert the
+            # monitor should raise, so jobs with alerts always run
+            if monitor is None and self._from_cache(job):
+                with self.lock:
+                    self.jobs[job.id] = job
+                    self.progress[job.id] = 1.0
+                return job
+
+        with self.lock:
+            self.jobs[job.id] = job
+            self.progress[job.id] = 0.0
+            self.pending.append(job)
+            started = self._dispatch()
+        self._watch(started)
+
+        return job
+
+    def _start_pool(self):
+        self.pool = make_pool(self.model_path, self.max_concurrent)
+        # Workers load and warm up their models in the background, so the
+        # first job doesn't pay for it
+        start_workers(self.pool, self.max_concurrent)
+
+    def _restart_pool(self, broken):
+        # Caller holds the lock. A worker that dies (e.g. killed for running
+        # out of memory) breaks the whole pool and fails every job on it; it
+        # is replaced once, however many of those jobs report it
+        if self.pool is broken:
+            broken.shutdown(wait=False)
+            # Every worker of the old pool is gone; drop their last metrics
+            # so their gauges don't linger in /metrics
+            self.metrics.clear()
+            self._start_pool()
+
+    def _dispatch(self):
+        # Caller holds the lock; returns the (job, future, pool) it started,
+        # to be passed to _watch once the lock is released
+        started = []
+        while self.pending and self.running < self.max_concurrent:
+            job = self.pending.popleft()
+            pool = self.pool
+            try:
+                future = pool.submit(
+                    process_video_task, job.input_path, job.output_path, *job.args,
+                    progress=self.progress, key=job.id, shared_metrics=self.metrics, **job.kwargs,
+                )
+            except BrokenProcessPool:
+                # Broken before its jobs' callbacks ran; retry on a new pool
+                self._restart_pool(pool)
+                self.pending.appendleft(job)
+                continue
+            except Exception as e:
+                job.status = FAILED
+                job.error = e
+                job.finished_at = time.time()
+                continue
+            job.status = RUNNING
+            self.running += 1
+            started.append((job, future, pool))
+        metrics.QUEUE_DEPTH.set(len(self.pending), queue="jobs")
+        return started
+
+    def _watch(self, started):
+        # Without the lock held: a future that has already finished (e.g. the
+        # pool broke right after submit) runs _finished right here, which
+        # takes the lock itself
+        for job, future, pool in started:
+            future.add_done_callback(lambda f, job=job, pool=pool: self._finished(job, f, pool))
+
+    def _from_cache(self, job):
+        # Link a cached result into the job's directory; outputs such as the
+        # highlight clip are missing from an entry when nothing was detected
+        entry = self.cache.get(job.cache_key)
+        if entry is None:
+            return False
+
+        for role, path in job.outputs().items():
+            cached = os.path.join(entry, role + os.path.splitext(path)[1])
+            if os.path.exists(cached):
+                link_or_copy(cached, path)
+        job.status = DONE
+        job.cached = True
+        job.finished_at = time.time()
+        return True
+
+    def _finished(self, job, future, pool):
+        with self.lock:
+            try:
+                future.result()
+                job.status = DONE
+            except BrokenProcessPool:
+                # Which job killed the worker is unknown, so the jobs that were
+                # running fail rather than risk breaking the new pool again
+                job.status = FAILED
+                job.error = RuntimeError("The worker processing this video stopped unexpectedly (out of memory?)")
+                self._restart_pool(pool)
+            except Exception as e:
+                job.status = FAILED
+                job.error = e
+            job.finished_at = time.time()
+            self.running -= 1
+            started = self._dispatch()
+        self._watch(started)
+
+        if job.status == DONE and job.cache_key is not None:
+            self.cache.put(job.cache_key, {
+                role + os.path.splitext(path)[1]: path
+                for role, path in job.outputs().items() if os.path.exists(path)
+            })
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def queue_position(self, job):
+        # 1-based position among waiting jobs, 0 once it has started
+        with self.lock:
+            try:
+                return self.pending.index(job) + 1
+            except ValueError:
+                return 0
+
+    def job_progress(self, job):
+        return self.progress.get(job.id, 0.0)
+
+    def cleanup(self):
+        # Forget finished jobs older than max_age and delete their directories,
+        # along with any directory no live job owns (e.g. from a previous run)
+        cutoff = time.time() - self.max_age
+        with self.lock:
+            for job_id, job in list(self.jobs.items()):
+                if not job.active and job.finished_at < cutoff:
+                    del self.jobs[job_id]
+                    self.progress.pop(job_id, None)
+            live = set(self.jobs)
+
+        for entry in os.scandir(self.root):
+            if entry.name in live:
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except FileNotFoundError:
+                continue
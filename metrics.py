@@ -0,0 +1,239 @@
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; per-frame stages sit in the low buckets, model loading in the high ones
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metric:
+    # One Prometheus metric family: values keyed by a tuple of label values
+    def __init__(self, name, help, kind, labels=(), buckets=None):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def observe(self, value, **labels):
+        # Histogram: per-bucket counts (not cumulative), then sum and count
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self):
+        with self.lock:
+            if self.kind == "histogram":
+                values = {k: [list(v[0]), v[1], v[2]] for k, v in self.values.items()}
+            else:
+                values = dict(self.values)
+        return {"help": self.help, "kind": self.kind, "labels": self.labels, "buckets": self.buckets, "values": values}
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, name, help, kind, labels=(), buckets=None):
+        metric = self.metrics[name] = Metric(name, help, kind, labels, buckets)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(name, help, "counter", labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._add(name, help, "gauge", labels)
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self._add(name, help, "histogram", labels, buckets)
+
+    def snapshot(self):
+        # Plain, picklable copy of every value, so worker processes can hand
+        # theirs to the server process
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "extinguisher_stage_seconds",
+    "Time per frame in each pipeline stage; postprocess is ultralytics' NMS and box rescaling",
+    ("stage",),
+)
+FRAMES = REGISTRY.counter("extinguisher_frames_total", "Frames run through the model; use rate() for frames/sec", ("source",))
+FPS = REGISTRY.gauge("extinguisher_fps", "Frames per second of the last finished video or the running stream", ("source",))
+QUEUE_DEPTH = REGISTRY.gauge("extinguisher_queue_depth", "Items waiting in a pipeline queue", ("queue",))
+MODEL_LOAD_SECONDS = REGISTRY.histogram("extinguisher_model_load_seconds", "Time to load a model", ("backend",))
+STARTUP_SECONDS = REGISTRY.gauge(
+    "extinguisher_startup_seconds", "Time each cold-start phase took: import, load, warmup and ready (all of them)", ("phase",),
+)
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def observe_speed(r):
+    # ultralytics already times these three stages per image, in ms
+    for stage in ("preprocess", "inference", "postprocess"):
+        value = r.speed.get(stage)
+        if value is not None:
+            STAGE_SECONDS.observe(value / 1000, stage=stage)
+
+
+def merge(snapshots):
+    # Combine {worker: snapshot} from several processes. Counters and
+    # histograms are summed; gauges are not (the last fps of two workers is
+    # not a rate), so each one keeps its process in a worker label.
+    merged = {}
+    for worker, snapshot in snapshots.items():
+        for name, metric in snapshot.items():
+            gauge = metric["kind"] == "gauge"
+            labels = metric["labels"] + ("worker",) if gauge else metric["labels"]
+            target = merged.setdefault(name, {**metric, "labels": labels, "values": {}})
+            for key, value in metric["values"].items():
+                if gauge:
+                    target["values"][key + (str(worker),)] = value
+                    continue
+                current = target["values"].get(key)
+                if current is None:
+                    target["values"][key] = [list(value[0]), value[1], value[2]] if metric["kind"] == "histogram" else value
+                elif metric["kind"] == "histogram":
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+                else:
+                    target["values"][key] = current + value
+    return merged
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+def render(snapshot):
+    # Prometheus text exposition format
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for key, value in sorted(metric["values"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(metric['labels'], key)} {value}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, n in zip(metric["buckets"], counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(metric['labels'], key, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(metric['labels'], key, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_labels(metric['labels'], key)} {total}")
+            lines.append(f"{name}_count{_labels(metric['labels'], key)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+# Shared mappings that worker processes publish their snapshots into
+_sources = []
+
+
+def publish(shared, key=None):
+    # Store this process' snapshot in a shared (Manager) mapping; whoever
+    # owns the workers removes their entries once they are gone
+    shared[key or os.getpid()] = REGISTRY.snapshot()
+
+
+def add_source(shared):
+    _sources.append(shared)
+
+
+def collect():
+    # This process' metrics plus everything published by workers
+    snapshots = {"main": REGISTRY.snapshot()}
+    for shared in _sources:
+        snapshots.update(shared.items())
+    return merge(snapshots)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render(collect()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def start_metrics_server(port):
+    # One /metrics server per port and process, however many pages ask for it
+    with _servers_lock:
+        server = _servers.get(port)
+        if server is None:
+            server = _servers[port] = ThreadingHTTPServer(("", port), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+
+
+@contextmanager
+def profiled(name, directory=None):
+    # cProfile the block when directory (default $PROFILE_DIR) is set, and
+    # write <name>-<pid>-<time>.prof for pstats or snakeviz. Threads are
+    # named after their stage, so py-spy dumps are readable as well.
+    directory = directory or os.environ.get("PROFILE_DIR")
+    if not directory:
+        yield
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(directory, f"{name}-{os.getpid()}-{int(time.time())}.prof"))
@@ -0,0 +1,86 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import detection
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Relative to this file rather than the working directory, so every page and
+# script finds the same weights wherever streamlit was started from
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model", "best.pt")
+MODEL_PATH = os.environ.get("MODEL_PATH", DEFAULT_MODEL_PATH)
+
+# One loaded, warmed-up model per (weights, backend) for the whole process,
+# shared by every page and session
+_models = {}
+_lock = threading.Lock()
+# Seconds per cold-start phase of the last model loaded
+timings = {}
+
+
+@contextmanager
+def _phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - start, 3)
+        metrics.STARTUP_SECONDS.set(timings[name], phase=name)
+
+
+def model_key(model_path=None, backend=None):
+    # Different spellings of the same path (./model vs ../model from a page)
+    # share one entry
+    return os.path.realpath(model_path or MODEL_PATH), backend or os.environ.get("MODEL_BACKEND", "torch")
+
+
+def get_model(model_path=None, backend=None):
+    # Loads and warms up on first use; callers arriving during a load wait
+    # for it rather than loading a second copy
+    key = model_key(model_path, backend)
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            model = _models[key] = _load(*key)
+    return model
+
+
+def _load(model_path, backend):
+    with _phase("ready"):
+        with _phase("import"):
+            import ultralytics  # noqa: F401
+
+        with _phase("load"):
+            model = detection.load_model(model_path, backend)
+        with _phase("warmup"):
+            detection.warm_up(model)
+    logger.info("Model %s (%s) ready in %.1fs: %s", model_path, backend, timings["ready"], timings)
+    return model
+
+
+def preload(model_path=None, backend=None):
+    # Start loading in the background, so a page can render its controls
+    # while the weights load; get_model picks up the result
+    thread = threading.Thread(target=get_model, args=(model_path, backend), name="model-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time a cold start: imports, model load and warm-up")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--backend", choices=["torch", "onnx", "openvino", "int8", "auto"], default=None)
+    args = parser.parse_args()
+
+    get_model(args.model, args.backend)
+    print(json.dumps(timings, indent=2))
+
+
+if __name__ == "__main__":
+    main()
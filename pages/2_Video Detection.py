@@ -1,12 +1,36 @@
 import streamlit as st
-from glob import glob
-import cv2
-from ultralytics import YOLO
-from PIL import Image
 import os
-from tempfile import NamedTemporaryFile
-from numpy import random
-import io
+import json
+import mimetypes
+import time
+
+import detection
+import metrics
+import model_registry
+import storage
+import stream
+from events import AlertDispatcher, DetectionMonitor
+from jobs import FAILED, QUEUED, RUNNING, JobScheduler
+from result_cache import ResultCache
+from subscribers import SubscriberCache, get_firestore
+from tiling import Tiler
+from tracking import ByteTracker, TrackSampler
+
+# Inputs and results live on disk
+UPLOAD_DIR = "./uploads/incoming"
+JOBS_DIR = "./uploads/jobs"
+# Same filesystem as JOBS_DIR, so cached results are hard-linked rather than copied
+CACHE_DIR = "./uploads/cache"
+CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", max(1, (os.cpu_count() or 1) // 2)))
+# With DOWNLOAD_BASE_URL set, results are streamed from disk by a small file
+# server on DOWNLOAD_HOST:DOWNLOAD_PORT, e.g. behind the same proxy as the
+# app; without it they go through st.download_button
+DOWNLOAD_BASE_URL = os.environ.get("DOWNLOAD_BASE_URL")
+DOWNLOAD_HOST = os.environ.get("DOWNLOAD_HOST", "127.0.0.1")
+DOWNLOAD_PORT = int(os.environ.get("DOWNLOAD_PORT", 8502))
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9102))
+MAX_FILE_AGE = 6 * 60 * 60
 
 st.set_page_config(
         page_title="Video-based Detection",
@@ -122,112 +146,251 @@ gif_url = "images/vdosidebar.gif"
 st.sidebar.image(gif_url, use_column_width=True)
 
 @st.cache_resource
-def load_model(model_path):
-    model = YOLO(model_path)
-    return model
+def get_scheduler(model_path):
+    # One scheduler per server, shared by every session
+    cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES)
+    return JobScheduler(model_path, JOBS_DIR, MAX_CONCURRENT_JOBS, MAX_FILE_AGE, cache)
 
 
-def predict_image(model, image, conf_threshold, iou_threshold):
-    res = model.predict(
-        image,
-        conf=conf_threshold,
-        iou=iou_threshold,
-        device="cpu",
-    )
-
-    class_name = model.model.names
-    classes = res[0].boxes.cls
-    class_counts = {}
-
-    for c in classes:
-        c = int(c)
-        class_counts[class_name[c]] = class_counts.get(class_name[c], 0) + 1
-
-    prediction_text = "Predicted "
-    for k, v in sorted(class_counts.items(), key=lambda item: item[1], reverse=True):
-        prediction_text += f"{v} {k}"
-        
-        if v > 1:
-            prediction_text += "s"
-        
-        prediction_text += ", "
-
-    prediction_text = prediction_text[:-2]
-    if len(class_counts) == 0:
-        prediction_text = "No objects detected"
-
-    latency = sum(res[0].speed.values())  
-    latency = round(latency / 1000, 2)
-    prediction_text += f" in {latency} seconds."
-
-    res_image = res[0].plot()
-    res_image = cv2.cvtColor(res_image, cv2.COLOR_BGR2RGB)
-    
-    return res_image, prediction_text
-
-
-def process_video(model, video_path, output_path, conf_threshold, iou_threshold):
-    cap = cv2.VideoCapture(video_path)
+@st.cache_resource
+def preload_model():
+    # The in-process model is only used for streams; jobs run on the
+    # scheduler's workers, which warm up on their own
+    return model_registry.preload()
 
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    
-    fourcc = cv2.VideoWriter_fourcc(*"XVID") 
-    out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        res_image, _ = predict_image(model, frame, conf_threshold, iou_threshold)
-        
-        out.write(cv2.cvtColor(res_image, cv2.COLOR_RGB2BGR))
-
-        if cv2.waitKey(1) & 0xFF == ord("q"):
-            break
+@st.cache_resource
+def get_download_server():
+    return storage.start_download_server(JOBS_DIR, DOWNLOAD_PORT, DOWNLOAD_HOST)
 
-    cap.release()
-    out.release()
-    cv2.destroyAllWindows()
 
+def download(label, path, key):
+    if DOWNLOAD_BASE_URL:
+        st.markdown(f"[{label}]({storage.download_url(DOWNLOAD_BASE_URL, JOBS_DIR, path)})")
+    else:
+        with open(path, "rb") as f:
+            st.download_button(
+                label, f, file_name=os.path.basename(path), mime=mimetypes.guess_type(path)[0], key=key,
+            )
 
-uploaded_video = st.file_uploader("Choose a video...", type=["mp4", "mov", "avi", "mkv"])
 
-if uploaded_video is not None:
-    temp_video = NamedTemporaryFile(delete=False, suffix=".mp4")
-    temp_video.write(uploaded_video.read())  
-    temp_video.close()  
+@st.cache_resource
+def get_metrics_server():
+    # Prometheus /metrics for the whole app, including the job workers
+    return metrics.start_metrics_server(METRICS_PORT)
 
-    st.video(uploaded_video)
 
-    model_path = "../model/best.pt"
-    model = load_model(model_path)
+@st.cache_resource
+def get_dispatcher(_scheduler):
+    # Emails subscribers for every event raised by jobs or streams
+    subscribers = SubscriberCache(get_firestore(), "users").start()
+    return AlertDispatcher(_scheduler.events, subscribers.emails).start()
+
+
+def alert_settings():
+    # Sidebar controls for automatic alerts; returns a monitor or None
+    st.sidebar.subheader("Automatic Alerts")
+    if not st.sidebar.checkbox("Email subscribers on sustained fire"):
+        return None
+
+    min_frames = st.sidebar.number_input("Frames with fire or smoke", min_value=1, max_value=300, value=5)
+    min_conf = st.sidebar.slider("Minimum confidence", 0.0, 1.0, 0.6, 0.05)
+    window = st.sidebar.number_input("Within seconds", min_value=1, max_value=600, value=10)
+    cooldown = st.sidebar.number_input("Minutes between alerts per location", min_value=1, max_value=1440, value=10)
+
+    dispatcher = get_dispatcher(scheduler)
+    for event, status in reversed(dispatcher.history):
+        st.sidebar.caption(f"{time.strftime('%H:%M:%S', time.localtime(event.created))} {event.location}: {status}")
+
+    return DetectionMonitor(scheduler.events, min_frames, min_conf, window, cooldown * 60)
+
+
+def save_uploads(uploaded_videos):
+    # Copy each upload to disk once per session, not on every rerun
+    saved = st.session_state.setdefault("saved_uploads", {})
+    paths = []
+    for uploaded_video in uploaded_videos:
+        path = saved.get(uploaded_video.id)
+        if path is None or not os.path.exists(path):
+            path = storage.save_upload(uploaded_video, UPLOAD_DIR)
+            saved[uploaded_video.id] = path
+        paths.append(path)
+    return paths
+
+
+def show_jobs(scheduler, job_ids, wait=True):
+    # Render this session's jobs and, with wait, keep refreshing while any
+    # are unfinished
+    jobs = [job for job in map(scheduler.get, job_ids) if job is not None]
+    placeholders = [st.empty() for _ in jobs]
+    shown = {}
+
+    while True:
+        for job, placeholder in zip(jobs, placeholders):
+            # Finished jobs are drawn once; their download buttons can't be
+            # added twice in one run
+            if shown.get(job.id) == job.status and not job.active:
+                continue
+            shown[job.id] = job.status
+            with placeholder.container():
+                if job.status == QUEUED:
+                    st.info(f"{job.name}: waiting, position {scheduler.queue_position(job)} in queue")
+                elif job.status == RUNNING:
+                    st.progress(scheduler.job_progress(job), text=job.name)
+                elif job.status == FAILED:
+                    st.error(f"Failed to process {job.name}: {job.error}")
+                else:
+                    if job.cached:
+                        st.caption(f"{job.name} was processed before with the same settings, reusing the result.")
+                    if job.summary_path and os.path.exists(job.summary_path):
+                        with open(job.summary_path) as f:
+                            summary = json.load(f)
+                        found = ", ".join(
+                            f"{c['count']} {c['class']} (max confidence {c['max_conf']:.2f})" for c in summary["classes"]
+                        )
+                        st.write(f"{job.name}: {found or 'nothing'} detected in {summary['frames']} frames.")
+                    if job.output_path:
+                        download(f"Download Processed {job.name}", job.output_path, f"{job.id}-output")
+                    if job.log_path:
+                        download(f"Download Detections for {job.name}", job.log_path, f"{job.id}-log")
+                    if job.tracks_path:
+                        download(f"Download Fire Tracks for {job.name}", job.tracks_path, f"{job.id}-tracks")
+                    if job.highlight_path:
+                        # The clip is only created once something is detected
+                        if os.path.exists(job.highlight_path):
+                            download(f"Download Highlights of {job.name}", job.highlight_path, f"{job.id}-highlight")
+                        else:
+                            st.write(f"No fire or smoke detected in {job.name}, so there is no highlight clip.")
+
+        if not wait or not any(job.active for job in jobs):
+            return
+        time.sleep(0.5)
+
+
+def show_stream(area):
+    # Run the live stream into area until it ends or the session goes away
+    with area:
+        model = model_registry.get_model(model_path)
+        frame_placeholder = st.empty()
+        metrics_placeholder = st.empty()
+
+    def on_frame(index, r, stats):
+        frame_placeholder.image(detection.annotate(r.orig_img, r), channels="BGR", caption=f"Frame {index}", use_column_width=True)
+        with metrics_placeholder.container():
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Detection latency", f"{stats['latency_ms']} ms", help=f"p95 {stats['latency_p95_ms']} ms")
+            col2.metric("Processed FPS", stats["processed_fps"])
+            col3.metric("Dropped frames", f"{stats['drop_rate']:.0%}")
+        if monitor is not None and monitor.observe(stream_location or source, r):
+            area.warning(f"Sustained fire detected at {stream_location or source}, alerting subscribers")
+
+    try:
+        stream_tracker = ByteTracker(high_thresh=0.5) if track_stream else None
+        stream.run_stream(model, source, 0.5, 0.5, on_frame, tracker=stream_tracker)
+    except IOError as e:
+        area.error(str(e))
+
+
+
+storage.prune(UPLOAD_DIR, MAX_FILE_AGE)
+
+model_path = model_registry.MODEL_PATH
+scheduler = get_scheduler(model_path)
+preload_model()
+if DOWNLOAD_BASE_URL:
+    get_download_server()
+get_metrics_server()
+monitor = alert_settings()
+
+
+uploaded_videos = st.file_uploader("Choose videos...", type=["mp4", "mov", "avi", "mkv"], accept_multiple_files=True)
+
+if uploaded_videos:
+    temp_videos = save_uploads(uploaded_videos)
+
+    # Previewing copies the whole file into the media cache, so skip it for big uploads
+    if len(uploaded_videos) == 1 and uploaded_videos[0].size <= 200 * 1024 * 1024:
+        st.video(uploaded_videos[0])
+
+    batch_size = st.number_input("Frames per inference batch", min_value=1, max_value=64, value=8)
+
+    # Tracking keeps one id per fire and hides boxes that only flicker up for a frame
+    tracker = None
+    if st.checkbox("Track fires across frames"):
+        tracker = ByteTracker(high_thresh=0.5)
+
+    # Sampling mode: skipped frames are annotated with the last detected boxes
+    modes = ("Every frame", "Every k-th frame", "Scene changes only")
+    if tracker is not None:
+        modes += ("Every k-th frame while tracks are stable",)
+    sampling = st.radio("Detect on:", modes)
+    sampler = None
+    if sampling == "Every k-th frame while tracks are stable":
+        every = st.number_input("Detect every k-th frame while nothing changes", min_value=1, max_value=300, value=5)
+        sampler = TrackSampler(tracker, every=every)
+    elif sampling == "Every k-th frame":
+        every = st.number_input("Detect every k-th frame", min_value=1, max_value=300, value=5)
+        sampler = detection.FrameSampler(every=every)
+    elif sampling == "Scene changes only":
+        diff_threshold = st.slider("Frame difference threshold", 0.0, 0.5, 0.05, 0.01)
+        max_skip = st.number_input("Detect at least every N frames", min_value=1, max_value=300, value=30)
+        sampler = detection.FrameSampler(diff_threshold=diff_threshold, max_skip=max_skip)
+
+    # Tiled inference keeps small, distant fires visible in high-resolution footage
+    tiler = None
+    if st.checkbox("Tiled inference for high-resolution video"):
+        tile_size = st.select_slider("Tile size", options=[320, 480, 640, 960, 1280], value=640)
+        prepass = st.checkbox("Only tile regions flagged by a low-resolution pre-pass")
+        tiler = Tiler(tile_size=tile_size, batch_size=batch_size, prepass_imgsz=320 if prepass else None)
+
+    # A detection log lets analytics query boxes without decoding the output video
+    output = st.radio("Output:", ("Annotated video", "Annotated video and detection log", "Detection log only"))
+    log_format = None
+    if output != "Annotated video":
+        log_format = st.selectbox("Detection log format", ("jsonl", "parquet"))
+    highlights = st.checkbox("Save a short highlight clip around detections")
+
+    location = None
+    if monitor is not None:
+        location = st.text_input("Camera location for alerts (defaults to the file name)") or None
 
     if st.button("Process Video"):
-        with st.spinner("Processing video..."):
-            output_video_path = "./uploads/processed_video.mp4" 
-            conf_threshold = 0.5
-            iou_threshold = 0.5
-
-            process_video(model, temp_video.name, output_video_path, conf_threshold, iou_threshold)
-
-            st.success("The video has been processed.")
-
-
-            # Download button for the processed video
-            with open(output_video_path, "rb") as file:
-                st.download_button(
-                    label="Download Processed Video",
-                    data=file.read(),
-                    file_name="processed_video.mp4",
-                    mime="video/mp4",
-                )
-
-            os.unlink(temp_video.name) 
-            os.unlink(output_video_path) 
-
+        conf_threshold = 0.5
+        iou_threshold = 0.5
+
+        job_ids = st.session_state.setdefault("video_jobs", [])
+        for uploaded_video, temp_path in zip(uploaded_videos, temp_videos):
+            stem = os.path.splitext(uploaded_video.name)[0]
+            name = f"processed_{stem}.mp4" if output != "Detection log only" else None
+            log_name = f"detections_{stem}.{log_format}" if log_format else None
+            highlight_name = f"highlights_{stem}.mp4" if highlights else None
+            job = scheduler.submit(
+                uploaded_video.name, temp_path, name,
+                conf_threshold, iou_threshold, batch_size, sampler, tiler,
+                monitor=monitor, location=location, log_name=log_name, highlight_name=highlight_name,
+                tracker=tracker, tracks_name=f"tracks_{stem}.json", summary_name=f"summary_{stem}.json",
+            )
+            job_ids.append(job.id)
+
+# Filled in after the stream controls and footer are drawn, since both the
+# job progress and a running stream keep the script busy
+jobs_area = st.container()
+
+st.markdown("---")
+st.subheader("Live Stream")
+
+# Always detects on the newest frame and drops stale ones, so latency stays
+# bounded. Only cameras and network streams: local files would let any
+# visitor open paths on the server, so those are left to stream.py.
+source = st.text_input("RTSP/HTTP stream URL or webcam index:").strip()
+track_stream = st.checkbox("Track fires in the stream")
+stream_location = st.text_input("Stream location for alerts (defaults to the stream address)") if monitor is not None else None
+start_stream = False
+if source and not stream.is_live_source(source):
+    st.error("Enter an rtsp://, http:// or https:// stream URL or a webcam index.")
+elif source:
+    start_stream = st.button("Start Stream")
+stream_area = st.container()
 
 
 # footer
@@ -287,4 +450,12 @@ st.markdown(
         </div>
         """,
         unsafe_allow_html=True,
-    )
\ No newline at end of file
+    )
+
+
+# A running stream keeps the script busy, so job progress is drawn once
+# beside it rather than polled
+with jobs_area:
+    show_jobs(scheduler, st.session_state.get("video_jobs", []), wait=not start_stream)
+if start_stream:
+    show_stream(stream_area)
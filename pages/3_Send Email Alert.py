@@ -1,15 +1,11 @@
 import streamlit as st
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import firebase_admin
-from firebase_admin import credentials, db, firestore
+import time
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate("mycredentials.json")
-    firebase_admin.initialize_app(cred)
+from alerts import SENT, SMTPConfigError, send_bulk_email
+from events import ALERT_MESSAGE, ALERT_SUBJECT
+from subscribers import SubscriberCache, add_subscriber, get_firestore, import_subscribers, read_subscriber_csv
 
-db = firestore.client()
+db = get_firestore()
 
 st.set_page_config(
         page_title="Emergency Alert",
@@ -84,73 +80,62 @@ st.markdown('''
     unsafe_allow_html=True)
 
 
-# Function to send an email alert
-def send_email(to_email, subject, message):
-    smtp_server = "smtp.gmail.com"
-    smtp_port = 587
-    smtp_user = "2021ugcs049@nitjsr.ac.in" 
-    smtp_password = "lpqmchwljzvvppis"  
-
-    # Create the email
-    msg = MIMEMultipart()
-    msg['From'] = smtp_user
-    msg['To'] = to_email
-    msg['Subject'] = subject
-
-    # Attach the message
-    msg.attach(MIMEText(message, 'plain'))
-
-    try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password) 
-        server.send_message(msg) 
-        server.quit()
-
-        return "Email sent successfully!"
-    except Exception as e:
-        return f"Failed to send email: {str(e)}"
-
-# Function to get all documents from a collection
-def fetch_all_documents(collection_name):
-    collection_ref = db.collection(collection_name)
-    docs = collection_ref.stream()
-
-    doc_list = [doc.to_dict() for doc in docs]
-    return doc_list
+# Subscriber list shared by every session, kept fresh by a Firestore listener
+@st.cache_resource
+def get_subscribers():
+    return SubscriberCache(db, "users").start()
 
 
 st.subheader("Send Alert to all")
 
-subject = st.text_input("Subject", "❗Alert there is a fire❗")
-message = st.text_area("Message", """A forest fire has been detected near your area.
-Please stay safe and take necessary precautions.""")
+subject = st.text_input("Subject", ALERT_SUBJECT)
+message = st.text_area("Message", ALERT_MESSAGE.format(location="your area"))
 
 if st.button("Send"):
-    collection_name = "users"
-    data = fetch_all_documents(collection_name)
-    result = ""
-    if data:
-        for i in data:
-            user_email = i["email"]
-            result = send_email(user_email, subject, message)
+    with st.spinner("Sending alerts..."):
+        start = time.perf_counter()
+        try:
+            results = send_bulk_email(get_subscribers().emails(), subject, message)
+        except SMTPConfigError as e:
+            st.error(str(e))
+            st.stop()
+        elapsed = time.perf_counter() - start
+
+    if results:
+        failed = {email: status for email, status in results.items() if status != SENT}
+        st.write(f"Sent {len(results) - len(failed)} of {len(results)} alerts in {elapsed:.1f} seconds.")
+        if failed:
+            st.error(f"{len(failed)} alerts could not be delivered:")
+            st.table([{"email": email, "status": status} for email, status in failed.items()])
 
     else:
         st.write("No data found in the specified collection.")
 
-    st.write(result)
-
 st.subheader("Add New User")
 
 # Add new user
 name = st.text_input("Name:")
 email = st.text_input("Email:")
-user_data = {"name": name, "email": email}
 
-# Adding a document to Firestore
+# Adding a document to Firestore, keyed by email so it is never added twice
 if st.button("Add User"):
-    result = db.collection("users").add(user_data)
-    st.write("Added user data to Firestore")
+    try:
+        add_subscriber(db, name, email, "users")
+        st.write("Added user data to Firestore")
+    except ValueError as e:
+        st.error(str(e))
+
+st.subheader("Import Users")
+
+# Bulk import from a CSV with "name" and "email" columns
+uploaded_csv = st.file_uploader("Upload a CSV with name and email columns", type=["csv"])
+if uploaded_csv is not None and st.button("Import Users"):
+    with st.spinner("Importing users..."):
+        counts = import_subscribers(db, read_subscriber_csv(uploaded_csv), "users")
+    st.write(
+        f"Imported {counts['imported']} users, skipped {counts['duplicates']} duplicates "
+        f"and {counts['invalid']} rows without a valid email."
+    )
 
 
 
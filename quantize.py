@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import time
+from glob import glob
+
+import cv2
+import numpy as np
+import psutil
+
+from backends import compare_results, export_model, quantized_path
+from detection import load_model, predict_batch
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".webp"}
+
+
+def sample_calibration_frames(folder, limit=64, every=15):
+    # Still images as-is, plus every n-th frame of each video in the folder
+    frames = []
+    for path in sorted(glob(os.path.join(folder, "*"))):
+        if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+            frame = cv2.imread(path)
+            if frame is not None:
+                frames.append(frame)
+            continue
+
+        cap = cv2.VideoCapture(path)
+        index = 0
+        while cap.isOpened():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % every == 0:
+                frames.append(frame)
+            index += 1
+        cap.release()
+
+    # Spread the limit evenly over everything that was collected
+    if len(frames) > limit:
+        frames = [frames[i] for i in np.linspace(0, len(frames) - 1, limit).astype(int)]
+    return frames
+
+
+def preprocess(frame, imgsz=640):
+    # Same letterbox, RGB and scaling the exported model sees from ultralytics
+    h, w = frame.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    nh, nw = round(h * r), round(w * r)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    canvas[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    image = canvas[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(image, dtype=np.float32)[None] / 255
+
+
+def quantize(weights, frames, imgsz=640):
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self, input_name):
+            self.inputs = iter({input_name: preprocess(frame, imgsz)} for frame in frames)
+
+        def get_next(self):
+            return next(self.inputs, None)
+
+    fp32_path = export_model(weights, "onnx", imgsz)
+    int8_path = quantized_path(weights)
+
+    quantize_static(
+        fp32_path,
+        int8_path,
+        FrameReader("images"),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    return fp32_path, int8_path
+
+
+def measure(model_path, frames, conf_threshold, iou_threshold, runs=3):
+    # Load time, RSS growth from loading and running the model, ms per frame
+    process = psutil.Process()
+    rss = process.memory_info().rss
+    start = time.perf_counter()
+    model = load_model(model_path)
+    predict_batch(model, frames[:1], conf_threshold, iou_threshold)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        res = [predict_batch(model, [frame], conf_threshold, iou_threshold)[0] for frame in frames]
+    seconds = (time.perf_counter() - start) / runs / len(frames)
+
+    return {
+        "file_mb": round(os.path.getsize(model_path) / 1024 / 1024, 2),
+        "load_seconds": round(load_seconds, 2),
+        "rss_mb": round((process.memory_info().rss - rss) / 1024 / 1024, 1),
+        "ms_per_frame": round(seconds * 1000, 2),
+    }, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the model to INT8 and compare it with FP32")
+    parser.add_argument("--model", default="./model/best.pt")
+    parser.add_argument("--calibration", default="test videos", help="folder of images and videos to calibrate on")
+    parser.add_argument("--frames", type=int, default=64, help="number of calibration frames")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.5)
+    args = parser.parse_args()
+
+    frames = sample_calibration_frames(args.calibration, args.frames)
+    if not frames:
+        parser.error(f"no images or video frames found in {args.calibration}")
+
+    # Calibrate and evaluate on alternating frames so the two sets don't overlap
+    eval_frames = frames[1::2] or frames
+    fp32_path, int8_path = quantize(args.model, frames[::2], args.imgsz)
+
+    fp32, fp32_res = measure(fp32_path, eval_frames, args.conf, args.iou)
+    int8, int8_res = measure(int8_path, eval_frames, args.conf, args.iou)
+
+    report = {
+        "fp32": fp32,
+        "int8": int8,
+        "agreement": compare_results(fp32_res, int8_res),
+        "speedup": round(fp32["ms_per_frame"] / int8["ms_per_frame"], 2),
+        "size_ratio": round(int8["file_mb"] / fp32["file_mb"], 2),
+    }
+    print(json.dumps(report, indent=2))
+    print(f"Wrote {int8_path}; run with MODEL_BACKEND=int8 to use it")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+CHUNK_SIZE = 1024 * 1024
+
+_model_versions = {}
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    # Streamed, so large videos are never read into memory at once
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def model_version(model_path):
+    # Content hash of the weights (or of every file in an exported model
+    # directory), remembered per path until the files change
+    if os.path.isdir(model_path):
+        files = sorted(
+            os.path.join(dirpath, name)
+            for dirpath, _, names in os.walk(model_path) for name in names
+        )
+    else:
+        files = [model_path]
+
+    stamp = tuple((f, os.path.getmtime(f), os.path.getsize(f)) for f in files)
+    cached = _model_versions.get(model_path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    for f in files:
+        digest.update(os.path.relpath(f, model_path).encode())
+        digest.update(hash_file(f).encode())
+    version = digest.hexdigest()[:16]
+    _model_versions[model_path] = (stamp, version)
+    return version
+
+
+def _describe(value):
+    # JSON fallback for option objects such as FrameSampler or Tiler
+    return {type(value).__name__: {k: v for k, v in vars(value).items() if not k.startswith("_")}}
+
+
+class ResultCache:
+    # Results on disk keyed by content hash, model version and the options
+    # that change the output, so repeated submissions skip inference. Each
+    # entry is a directory of files; reading an entry marks it as recently
+    # used, and once the cache grows past max_bytes the least recently used
+    # entries are deleted.
+    def __init__(self, root, max_bytes=2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, content_hash, model_version, **options):
+        options = json.dumps(options, sort_keys=True, default=_describe)
+        return hash_bytes(f"{content_hash}:{model_version}:{options}".encode())
+
+    def get(self, key):
+        # Directory of a complete entry, or None
+        path = os.path.join(self.root, key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, files):
+        # files maps names to bytes or to paths of files to add; paths are
+        # hard-linked when possible so large outputs are not copied
+        tmp = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        try:
+            for name, value in files.items():
+                target = os.path.join(tmp, name)
+                if isinstance(value, bytes):
+                    with open(target, "wb") as f:
+                        f.write(value)
+                else:
+                    link_or_copy(value, target)
+
+            # Entries only appear complete; a concurrent put of the same key wins
+            try:
+                os.rename(tmp, os.path.join(self.root, key))
+            except OSError:
+                shutil.rmtree(tmp, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self.evict()
+        return self.get(key)
+
+    def entries(self):
+        # (last_used, size, path) of every complete entry
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.startswith(".tmp-") or not entry.is_dir():
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def evict(self):
+        with self.lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+            # Leftovers from interrupted writes
+            cutoff = time.time() - 24 * 60 * 60
+            for entry in os.scandir(self.root):
+                if entry.name.startswith(".tmp-") and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
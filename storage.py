@@ -0,0 +1,67 @@
+import os
+import shutil
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import NamedTemporaryFile
+from urllib.parse import quote
+
+# Uploads are copied to disk in chunks of this size instead of one read()
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_upload(uploaded_file, directory, suffix=".mp4"):
+    # Copy an uploaded file-like object to disk without materialising a
+    # second full copy of its bytes
+    os.makedirs(directory, exist_ok=True)
+    uploaded_file.seek(0)
+    with NamedTemporaryFile(delete=False, dir=directory, suffix=suffix) as f:
+        shutil.copyfileobj(uploaded_file, f, CHUNK_SIZE)
+    return f.name
+
+
+def prune(root, max_age):
+    # Remove files and directories under root not modified for max_age seconds
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - max_age
+    for entry in os.scandir(root):
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.unlink(entry.path)
+        except FileNotFoundError:
+            continue
+
+
+class _DownloadHandler(SimpleHTTPRequestHandler):
+    # Serves files straight from disk in chunks; no directory listings
+
+    def list_directory(self, path):
+        self.send_error(404)
+        return None
+
+    def end_headers(self):
+        self.send_header("Content-Disposition", "attachment")
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_download_server(root, port, host="127.0.0.1"):
+    # Only local by default; results sit in random per-job directories, but
+    # the server has no authentication of its own
+    os.makedirs(root, exist_ok=True)
+    server = ThreadingHTTPServer((host, port), partial(_DownloadHandler, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def download_url(base_url, root, path):
+    relative = os.path.relpath(path, root).replace(os.sep, "/")
+    return f"{base_url.rstrip('/')}/{quote(relative)}"
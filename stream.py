@@ -0,0 +1,162 @@
+import argparse
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import cv2
+import numpy as np
+
+import metrics
+from detection import load_model, predict_batch
+from tracking import ByteTracker
+
+LIVE_SCHEMES = ("rtsp", "rtsps", "http", "https")
+
+
+def open_source(source):
+    # Webcam index, RTSP/HTTP URL or a local file
+    return cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+
+
+def is_live_source(source):
+    # Webcam index or network stream, as opposed to a local file
+    source = str(source).strip()
+    return source.isdigit() or urlparse(source).scheme.lower() in LIVE_SCHEMES
+
+
+class LatestFrameReader:
+    # Reads a capture on its own thread and only keeps the newest frame, so a
+    # slow consumer never sees stale frames and latency stays bounded. With
+    # realtime=True a file is paced at its own fps, like a live camera.
+    def __init__(self, source, realtime=False):
+        self.cap = open_source(source)
+        if not self.cap.isOpened():
+            raise IOError(f"Could not open stream {source}")
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.interval = 1 / fps if realtime and fps > 0 else 0
+        self.cond = threading.Condition()
+        self.latest = None
+        self.captured = 0
+        self.dropped = 0
+        self.ended = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        next_time = time.perf_counter()
+        try:
+            while not self.ended:
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+
+                with self.cond:
+                    # The previous frame was never picked up: it is dropped
+                    if self.latest is not None:
+                        self.dropped += 1
+                    self.latest = (self.captured, frame, time.perf_counter())
+                    self.captured += 1
+                    self.cond.notify()
+
+                if self.interval:
+                    next_time += self.interval
+                    time.sleep(max(0.0, next_time - time.perf_counter()))
+        finally:
+            with self.cond:
+                self.ended = True
+                self.cond.notify()
+
+    def read(self, timeout=5.0):
+        # Newest (index, frame, capture_time), or None once the stream ends
+        with self.cond:
+            self.cond.wait_for(lambda: self.latest is not None or self.ended, timeout)
+            item, self.latest = self.latest, None
+            return item
+
+    def stop(self):
+        self.ended = True
+        self.thread.join()
+        self.cap.release()
+
+
+class StreamStats:
+    # Rolling detection latency (capture to result) and drop-rate metrics
+    def __init__(self, window=100):
+        self.latencies = deque(maxlen=window)
+        self.processed = 0
+        self.started = time.perf_counter()
+
+    def update(self, capture_time):
+        self.latencies.append(time.perf_counter() - capture_time)
+        self.processed += 1
+
+    def snapshot(self, reader):
+        latencies = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        elapsed = time.perf_counter() - self.started
+        return {
+            "latency_ms": round(float(latencies[-1]), 1),
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "latency_p95_ms": round(float(np.percentile(latencies, 95)), 1),
+            "processed_fps": round(self.processed / elapsed, 2) if elapsed else 0.0,
+            "captured": reader.captured,
+            "dropped": reader.dropped,
+            "drop_rate": round(reader.dropped / reader.captured, 3) if reader.captured else 0.0,
+        }
+
+
+def run_stream(model, source, conf_threshold, iou_threshold, on_frame, realtime=False, tiler=None, stop=None,
+               tracker=None):
+    # Detect on the newest frame of a live source until it ends or stop is
+    # set; on_frame(index, result, metrics) gets every processed frame, as
+    # tracks if a tracker is given
+    reader = LatestFrameReader(source, realtime)
+    stats = StreamStats()
+    if tracker is not None:
+        conf_threshold = min(conf_threshold, tracker.low_thresh)
+    try:
+        while stop is None or not stop.is_set():
+            item = reader.read()
+            if item is None:
+                if reader.ended:
+                    break
+                continue
+
+            index, frame, capture_time = item
+            r = predict_batch(model, [frame], conf_threshold, iou_threshold, tiler=tiler)[0]
+            metrics.observe_speed(r)
+            metrics.FRAMES.inc(source="stream")
+            if tracker is not None:
+                r = tracker.update(index, r)
+            stats.update(capture_time)
+            snapshot = stats.snapshot(reader)
+            metrics.FPS.set(snapshot["processed_fps"], source="stream")
+            on_frame(index, r, snapshot)
+    finally:
+        reader.stop()
+
+    return stats.snapshot(reader)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run detection on a live stream, dropping stale frames")
+    parser.add_argument("source", help="webcam index, RTSP/HTTP URL or video file")
+    parser.add_argument("--model", default="./model/best.pt")
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--realtime", action="store_true", help="replay a file at its own frame rate")
+    parser.add_argument("--track", action="store_true", help="report tracked fires instead of raw detections")
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+
+    def on_frame(index, r, stats):
+        print(f"frame {index}: {len(r.boxes)} detections, {stats}")
+
+    tracker = ByteTracker(high_thresh=args.conf) if args.track else None
+    print(run_stream(model, args.source, args.conf, args.iou, on_frame, realtime=args.realtime, tracker=tracker))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import csv
+import io
+import re
+import threading
+from urllib.parse import quote
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 500
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def get_firestore(credentials_path="mycredentials.json"):
+    # Firestore client, initializing the default Firebase app on first use
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(credentials_path))
+    return firestore.client()
+
+
+def normalize_email(email):
+    # Lower-cased, trimmed address, or None if it doesn't look like one
+    email = (email or "").strip().lower()
+    return email if EMAIL_PATTERN.match(email) else None
+
+
+def subscriber_id(email):
+    # Document id derived from the normalized address, so writing the same
+    # person twice updates one document instead of creating a duplicate
+    return quote(email, safe="@+")
+
+
+def add_subscriber(db, name, email, collection="users"):
+    email = normalize_email(email)
+    if email is None:
+        raise ValueError("Please enter a valid email address")
+    db.collection(collection).document(subscriber_id(email)).set({"name": name.strip(), "email": email}, merge=True)
+    return email
+
+
+def read_subscriber_csv(file):
+    # Rows of {"name", "email"} from an uploaded CSV with a header row;
+    # column names are matched case-insensitively
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    for row in reader:
+        row = {(k or "").strip().lower(): (v or "") for k, v in row.items()}
+        yield {"name": row.get("name", ""), "email": row.get("email", "")}
+
+
+def import_subscribers(db, rows, collection="users", batch_size=BATCH_SIZE):
+    # Write subscribers with batched writes keyed by normalized email, so
+    # re-importing the same file is idempotent
+    counts = {"imported": 0, "duplicates": 0, "invalid": 0}
+    seen = set()
+    batch = db.batch()
+    pending = 0
+    collection_ref = db.collection(collection)
+
+    for row in rows:
+        email = normalize_email(row.get("email"))
+        if email is None:
+            counts["invalid"] += 1
+            continue
+        if email in seen:
+            counts["duplicates"] += 1
+            continue
+        seen.add(email)
+
+        batch.set(collection_ref.document(subscriber_id(email)), {"name": row.get("name", "").strip(), "email": email}, merge=True)
+        pending += 1
+        if pending == batch_size:
+            batch.commit()
+            counts["imported"] += pending
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+        counts["imported"] += pending
+
+    return counts
+
+
+def iter_recipient_emails(db, collection="users", page_size=500):
+    # Page through the collection in document-id order, fetching only the
+    # email field, and yield addresses as each page arrives so sending can
+    # start before the whole collection has been read
+    query = db.collection(collection).select(["email"]).order_by("__name__").limit(page_size)
+    last = None
+    while True:
+        page = list((query.start_after(last) if last is not None else query).stream())
+        for doc in page:
+            email = normalize_email((doc.to_dict() or {}).get("email"))
+            if email:
+                yield email
+
+        if len(page) < page_size:
+            return
+        last = page[-1]
+
+
+class SubscriberCache:
+    # Local copy of the subscriber list kept fresh by a Firestore listener:
+    # the first snapshot loads every document once, after that only changes
+    # are applied. Until the first snapshot arrives, reads fall back to
+    # paging through the collection.
+    def __init__(self, db, collection="users", page_size=500):
+        self.db = db
+        self.collection = collection
+        self.page_size = page_size
+        self.emails_by_id = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.watch = None
+
+    def start(self):
+        self.watch = self.db.collection(self.collection).on_snapshot(self._on_snapshot)
+        return self
+
+    def stop(self):
+        if self.watch is not None:
+            self.watch.unsubscribe()
+            self.watch = None
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self.lock:
+            for change in changes:
+                doc = change.document
+                email = normalize_email((doc.to_dict() or {}).get("email"))
+                if change.type.name == "REMOVED" or not email:
+                    self.emails_by_id.pop(doc.id, None)
+                else:
+                    self.emails_by_id[doc.id] = email
+        self.ready.set()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.emails_by_id)
+
+    def emails(self):
+        if not self.ready.is_set():
+            return iter_recipient_emails(self.db, self.collection, self.page_size)
+        with self.lock:
+            return iter(list(self.emails_by_id.values()))
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NAMES = {0: "fire", 1: "smoke"}
+
+
+def make_result(rows, names=NAMES, shape=(480, 640)):
+    # A detection result as the model returns it, from (x1, y1, x2, y2, conf,
+    # class) rows, without running a model
+    import torch
+    from ultralytics.engine.results import Results
+
+    boxes = torch.tensor(rows, dtype=torch.float32).reshape(-1, 6)
+    return Results(orig_img=np.zeros((*shape, 3), dtype=np.uint8), path="", names=names, boxes=boxes)
+
+
+@pytest.fixture
+def result():
+    return make_result
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+from detection_log import DetectionLog
+from detection_summary import FLUSH_ROWS, DetectionSummary
+
+
+def random_boxes(rng, n, classes=3):
+    xy = rng.uniform(0, 500, (n, 2))
+    wh = rng.uniform(1, 100, (n, 2))
+    return rng.integers(0, classes, n), rng.uniform(0.1, 1.0, n), np.hstack([xy, xy + wh])
+
+
+def reference(classes, confs, boxes):
+    # The per-box loop the summary replaces
+    stats = {}
+    for c, conf, (x1, y1, x2, y2) in zip(classes, confs, boxes):
+        area = (x2 - x1) * (y2 - y1)
+        s = stats.setdefault(int(c), {"count": 0, "confs": [], "areas": []})
+        s["count"] += 1
+        s["confs"].append(conf)
+        s["areas"].append(area)
+    return {
+        c: (s["count"], max(s["confs"]), np.mean(s["confs"]), min(s["areas"]), np.mean(s["areas"]), max(s["areas"]))
+        for c, s in stats.items()
+    }
+
+
+def as_tuples(summary):
+    return {
+        c.name: (c.count, c.max_conf, c.mean_conf, c.min_area, c.mean_area, c.max_area)
+        for c in summary.classes()
+    }
+
+
+def assert_same(summary, expected):
+    got, expected = as_tuples(summary), as_tuples(expected)
+    assert got.keys() == expected.keys()
+    for name in expected:
+        assert got[name] == pytest.approx(expected[name])
+
+
+def test_matches_per_box_reference():
+    rng = np.random.default_rng(0)
+    classes, confs, boxes = random_boxes(rng, 10000)
+    summary = DetectionSummary({0: "a", 1: "b", 2: "c"}).add_boxes(classes, confs, boxes)
+
+    expected = reference(classes, confs, boxes)
+    got = as_tuples(summary)
+    assert set(got) == {"a", "b", "c"}
+    for i, name in enumerate("abc"):
+        assert got[name] == pytest.approx(expected[i])
+    assert summary.detections == 10000
+    # Most frequent class first
+    counts = [c.count for c in summary.classes()]
+    assert counts == sorted(counts, reverse=True)
+
+
+def test_results_frame_by_frame_match_boxes_at_once(result):
+    rng = np.random.default_rng(1)
+    frames = []
+    for _ in range(2 * FLUSH_ROWS // 10):
+        classes, confs, boxes = random_boxes(rng, int(rng.integers(0, 20)), classes=2)
+        frames.append(np.column_stack([boxes, confs, classes]).astype(np.float32))
+
+    summary = DetectionSummary()
+    for rows in frames:
+        summary.add(result(rows))
+    data = np.concatenate(frames)
+    expected = DetectionSummary({0: "fire", 1: "smoke"}).add_boxes(data[:, 5], data[:, 4], data[:, :4])
+
+    assert summary.frames == len(frames)
+    assert summary.frames_with_detections == sum(len(rows) > 0 for rows in frames)
+    assert_same(summary, expected)
+
+
+def test_merging_halves_equals_whole():
+    rng = np.random.default_rng(2)
+    classes, confs, boxes = random_boxes(rng, 5000)
+    names = {0: "a", 1: "b", 2: "c"}
+    whole = DetectionSummary(names).add_boxes(classes, confs, boxes)
+    first = DetectionSummary(names).add_boxes(classes[:2000], confs[:2000], boxes[:2000])
+    second = DetectionSummary(names).add_boxes(classes[2000:], confs[2000:], boxes[2000:])
+
+    merged = first.merge(second)
+    assert_same(merged, whole)
+
+
+def test_merge_matches_classes_by_name():
+    first = DetectionSummary({0: "fire", 1: "smoke"}).add_boxes([0, 1], [0.9, 0.4], [[0, 0, 10, 10], [0, 0, 2, 2]])
+    second = DetectionSummary({0: "smoke", 1: "fire", 2: "ember"}).add_boxes(
+        [0, 1, 2], [0.6, 0.5, 0.3], [[0, 0, 4, 4], [0, 0, 20, 20], [0, 0, 1, 1]],
+    )
+
+    merged = as_tuples(first.merge(second))
+    assert merged["fire"] == pytest.approx((2, 0.9, 0.7, 100, 250, 400))
+    assert merged["smoke"] == pytest.approx((2, 0.6, 0.5, 4, 10, 16))
+    assert merged["ember"] == pytest.approx((1, 0.3, 0.3, 1, 1, 1))
+
+
+def test_dict_round_trip():
+    rng = np.random.default_rng(3)
+    summary = DetectionSummary({0: "a", 1: "b", 2: "c"}).add_boxes(*random_boxes(rng, 100))
+    summary.frames = summary.frames_with_detections = 40
+
+    restored = DetectionSummary.from_dict(summary.to_dict())
+    assert restored.to_dict() == summary.to_dict()
+
+
+def test_from_log_matches_results(tmp_path, result):
+    frames = [
+        [[0, 0, 10, 20, 0.9, 0], [5, 5, 15, 15, 0.25, 1]],
+        [],
+        [[10, 10, 30, 30, 0.5, 0]],
+    ]
+    summary = DetectionSummary()
+    with DetectionLog(str(tmp_path / "log.jsonl")) as log:
+        for index, rows in enumerate(frames):
+            r = result(rows)
+            log.write(index, r)
+            summary.add(r)
+
+    from_log = DetectionSummary.from_log(str(tmp_path / "log.jsonl"))
+    assert_same(from_log, summary)
+    # Frames without boxes are not in a log
+    assert from_log.frames == 2
+
+
+def test_text():
+    summary = DetectionSummary({0: "fire", 1: "smoke"}).add_boxes([0, 0, 1], [0.9, 0.8, 0.7], np.ones((3, 4)))
+    assert summary.text() == "Predicted 2 fires, 1 smoke in 0.0 seconds."
+    assert DetectionSummary().text() == "No objects detected in 0.0 seconds."
@@ -0,0 +1,94 @@
+import queue
+
+import pytest
+
+import events
+from events import AlertDispatcher, DetectionMonitor
+
+FIRE = [[10, 10, 50, 50, 0.8, 0]]
+SMOKE_WEAK = [[10, 10, 50, 50, 0.3, 1]]
+
+
+def feed(monitor, result, frames, location="ridge"):
+    # frames: (timestamp, rows) pairs; returns the events raised
+    raised = [monitor.observe(location, result(rows), timestamp) for timestamp, rows in frames]
+    return [event for event in raised if event is not None]
+
+
+def test_sustained_fire_raises_one_event(result):
+    events_queue = queue.Queue()
+    monitor = DetectionMonitor(events_queue, min_frames=5, min_conf=0.5, window=10, cooldown=600)
+
+    raised = feed(monitor, result, [(t, FIRE) for t in range(20)])
+    assert len(raised) == 1
+    event = raised[0]
+    assert (event.location, event.timestamp, event.frames, event.classes) == ("ridge", 4, 5, ["fire"])
+    assert event.max_conf == pytest.approx(0.8)
+    assert event.cooldown == 600
+    assert events_queue.get_nowait() is event
+    assert events_queue.empty()
+
+
+def test_flickering_or_weak_detections_raise_nothing(result):
+    monitor = DetectionMonitor(queue.Queue(), min_frames=3, min_conf=0.5, window=2, cooldown=600)
+
+    # Never three hits within two seconds
+    assert feed(monitor, result, [(t, FIRE if t % 3 == 0 else []) for t in range(30)]) == []
+    # Below min_conf
+    assert feed(monitor, result, [(t, SMOKE_WEAK) for t in range(30, 60)]) == []
+
+
+def test_unwatched_classes_are_ignored(result):
+    monitor = DetectionMonitor(queue.Queue(), min_frames=2, min_conf=0.5, classes=("smoke",))
+    assert feed(monitor, result, [(t, FIRE) for t in range(10)]) == []
+
+
+def test_location_alerts_again_after_cooldown(result):
+    monitor = DetectionMonitor(queue.Queue(), min_frames=2, min_conf=0.5, window=10, cooldown=60)
+
+    raised = feed(monitor, result, [(t, FIRE) for t in range(0, 130, 5)])
+    assert [event.timestamp for event in raised] == [5, 65, 125]
+    # Locations are independent
+    assert len(feed(monitor, result, [(130, FIRE), (131, FIRE)], location="valley")) == 1
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+    monkeypatch.setattr(events, "send_bulk_email", lambda recipients, subject, message: sent.append(message) or {"a@b.c": "sent"})
+    return sent
+
+
+def test_dispatcher_enforces_cooldown_across_monitors(result, sent, monkeypatch):
+    # Each job has its own monitor, so the dispatcher is what keeps two
+    # uploads of one location within the cooldown to a single email
+    events_queue = queue.Queue()
+    now = [1000.0]
+    monkeypatch.setattr(events.time, "time", lambda: now[0])
+    dispatcher = AlertDispatcher(events_queue, lambda: ["a@b.c"])
+
+    for minute in (0, 5, 11):
+        now[0] = 1000.0 + minute * 60
+        monitor = DetectionMonitor(events_queue, min_frames=2, min_conf=0.5, window=10, cooldown=600)
+        feed(monitor, result, [(0, FIRE), (1, FIRE)])
+        dispatcher.dispatch(events_queue.get_nowait())
+
+    assert len(sent) == 2
+    assert [status for _, status in dispatcher.history] == [
+        "sent to 1 of 1 subscribers", "suppressed", "sent to 1 of 1 subscribers",
+    ]
+
+
+def test_dispatcher_min_interval_covers_short_cooldowns(result, sent, monkeypatch):
+    events_queue = queue.Queue()
+    now = [1000.0]
+    monkeypatch.setattr(events.time, "time", lambda: now[0])
+    dispatcher = AlertDispatcher(events_queue, lambda: ["a@b.c"], min_interval=60)
+
+    for seconds in (0, 30, 61):
+        now[0] = 1000.0 + seconds
+        monitor = DetectionMonitor(events_queue, min_frames=1, min_conf=0.5, cooldown=1)
+        feed(monitor, result, [(0, FIRE)])
+        dispatcher.dispatch(events_queue.get_nowait())
+
+    assert len(sent) == 2
@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import jobs
+from jobs import DONE, FAILED, JobScheduler
+
+
+class FakePool:
+    # Finishes every task before submit returns; the first broken pools fail
+    # them the way a killed worker does
+    def __init__(self, broken):
+        self.broken = broken
+        self.tasks = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.tasks += 1
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool("A child process terminated abruptly"))
+        else:
+            future.set_result(None)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    pools = []
+
+    def make_pool(model_path, workers):
+        pools.append(FakePool(broken=not pools))
+        return pools[-1]
+
+    monkeypatch.setattr(jobs, "make_pool", make_pool)
+    monkeypatch.setattr(jobs, "start_workers", lambda pool, workers: [])
+    scheduler = JobScheduler("model.pt", str(tmp_path / "jobs"), 1, 3600)
+    scheduler.pools = pools
+    yield scheduler
+    scheduler.manager.shutdown()
+
+
+def submit(scheduler, tmp_path, name):
+    video = tmp_path / f"{name}.mp4"
+    video.write_bytes(b"")
+    return scheduler.submit(name, str(video), None, 0.5, 0.5)
+
+
+def test_broken_pool_fails_running_job_and_is_replaced(scheduler, tmp_path):
+    scheduler.metrics[12345] = {"stale": "snapshot of a worker of the broken pool"}
+    # The future is already done when its callback is added, so _finished
+    # runs in the submitting thread; submit must not deadlock on the lock
+    thread = threading.Thread(target=lambda: submit(scheduler, tmp_path, "a"), daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+    first = next(iter(scheduler.jobs.values()))
+    assert first.status == FAILED
+    assert scheduler.running == 0
+    assert len(scheduler.pools) == 2
+    assert dict(scheduler.metrics) == {}
+
+    second = submit(scheduler, tmp_path, "b")
+    assert second.status == DONE
+    assert scheduler.pools[1].tasks == 1
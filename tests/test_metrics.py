@@ -0,0 +1,29 @@
+from metrics import Registry, merge, render
+
+
+def worker_snapshot(fps, frames, seconds):
+    registry = Registry()
+    registry.gauge("fps", "fps", ("source",)).set(fps, source="video")
+    registry.counter("frames_total", "frames", ("source",)).inc(frames, source="video")
+    histogram = registry.histogram("stage_seconds", "stage", ("stage",), buckets=(0.1, 1.0))
+    for value in seconds:
+        histogram.observe(value, stage="inference")
+    return registry.snapshot()
+
+
+def test_counters_and_histograms_are_summed_gauges_kept_per_worker():
+    merged = merge({
+        "main": worker_snapshot(0, 0, []),
+        101: worker_snapshot(12.5, 100, [0.05, 0.5]),
+        102: worker_snapshot(8.0, 50, [2.0]),
+    })
+
+    assert merged["frames_total"]["values"] == {("video",): 150}
+    assert merged["stage_seconds"]["values"][("inference",)] == [[1, 1], 2.55, 3]
+    assert merged["fps"]["labels"] == ("source", "worker")
+    assert merged["fps"]["values"] == {("video", "main"): 0, ("video", "101"): 12.5, ("video", "102"): 8.0}
+
+    text = render(merged)
+    assert 'fps{source="video",worker="101"} 12.5' in text
+    assert 'frames_total{source="video"} 150' in text
+    assert 'stage_seconds_bucket{stage="inference",le="+Inf"} 3' in text
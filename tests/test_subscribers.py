@@ -0,0 +1,90 @@
+import io
+
+import pytest
+
+from subscribers import add_subscriber, import_subscribers, normalize_email, read_subscriber_csv
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append((ref, data))
+
+    def commit(self):
+        self.db.commits.append(len(self.writes))
+        for ref, data in self.writes:
+            ref.set(data, merge=True)
+
+
+class FakeDocument:
+    def __init__(self, docs, key):
+        self.docs = docs
+        self.key = key
+
+    def set(self, data, merge=False):
+        self.docs.setdefault(self.key, {}).update(data)
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def document(self, doc_id):
+        return FakeDocument(self.db.docs, (self.name, doc_id))
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}
+        self.commits = []
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def subscriber_rows():
+    # 1200 people, 300 of them listed twice with different case and
+    # whitespace, plus one row without a usable address
+    rows = [{"name": f"User {i}", "email": f"user{i}@example.com"} for i in range(1200)]
+    rows += [{"name": f"User {i}", "email": f"  USER{i}@Example.com "} for i in range(300)]
+    rows.append({"name": "Nobody", "email": "not an email"})
+    return rows
+
+
+def test_import_batches_and_dedupes():
+    db = FakeFirestore()
+
+    counts = import_subscribers(db, subscriber_rows())
+    assert counts == {"imported": 1200, "duplicates": 300, "invalid": 1}
+    assert db.commits == [500, 500, 200]
+    assert len(db.docs) == 1200
+    assert db.docs[("users", "user7@example.com")] == {"name": "User 7", "email": "user7@example.com"}
+
+
+def test_reimport_is_idempotent():
+    db = FakeFirestore()
+    import_subscribers(db, subscriber_rows())
+    add_subscriber(db, "User 3", "User3@example.com")
+
+    counts = import_subscribers(db, subscriber_rows(), batch_size=1000)
+    assert counts["imported"] == 1200
+    assert db.commits[-2:] == [1000, 200]
+    assert len(db.docs) == 1200
+
+
+def test_read_subscriber_csv_matches_headers_loosely():
+    data = "\ufeffName, EMAIL \nAda,ada@example.com\nBob,\n".encode("utf-8")
+    rows = list(read_subscriber_csv(io.BytesIO(data)))
+    assert rows == [{"name": "Ada", "email": "ada@example.com"}, {"name": "Bob", "email": ""}]
+
+
+@pytest.mark.parametrize("email", ["", None, "a@b", "a b@c.d", "@c.d"])
+def test_normalize_email_rejects_invalid(email):
+    assert normalize_email(email) is None
@@ -0,0 +1,64 @@
+import numpy as np
+
+from tracking import ByteTracker, TrackSampler
+
+
+def moving_box(x, y, t, speed=1.0, size=60):
+    return [x + speed * t, y, x + speed * t + size, y + size]
+
+
+def test_synthetic_video_keeps_two_ids(result):
+    # Two fires drifting across 300 frames, with dropouts, dips below the
+    # high threshold and one-frame false positives in 10% of the frames
+    rng = np.random.default_rng(0)
+    tracker = ByteTracker(high_thresh=0.5, low_thresh=0.1)
+    shown_ids = set()
+    for t in range(300):
+        rows = []
+        if rng.random() > 0.1:
+            rows.append([*moving_box(50, 50, t), 0.3 if rng.random() < 0.2 else 0.8, 0])
+        if rng.random() > 0.1:
+            rows.append([*moving_box(300, 300, t, speed=-0.5), 0.7, 1])
+        if rng.random() < 0.1:
+            x, y = rng.uniform(0, 1500, 2)
+            rows.append([x, y + 600, x + 30, y + 630, 0.9, 0])
+        tracked = tracker.update(t, result(rows, shape=(2200, 1600)))
+        shown_ids.update(int(i) for i in tracked.boxes.id.tolist())
+
+    tracks = tracker.summary(fps=30)
+    assert len(tracks) == 2
+    assert shown_ids == {track["id"] for track in tracks}
+    assert sorted(track["class"] for track in tracks) == ["fire", "smoke"]
+    assert all(track["first_seen"] < 0.2 and track["last_seen"] > 9.5 for track in tracks)
+
+
+def test_tracks_are_confirmed_after_min_hits(result):
+    tracker = ByteTracker(min_hits=3)
+    shown = [len(tracker.update(t, result([[*moving_box(100, 100, t), 0.9, 0]])).boxes) for t in range(5)]
+    assert shown == [0, 0, 1, 1, 1]
+
+
+def test_low_confidence_boxes_only_extend_tracks(result):
+    tracker = ByteTracker(high_thresh=0.5, low_thresh=0.1, min_hits=1)
+    # A weak box on its own never starts a track
+    assert len(tracker.update(0, result([[0, 0, 50, 50, 0.3, 0]])).boxes) == 0
+    assert tracker.tracks == []
+
+    tracker.update(1, result([[100, 100, 150, 150, 0.9, 0]]))
+    tracked = tracker.update(2, result([[101, 100, 151, 150, 0.3, 0]]))
+    assert tracked.boxes.id.tolist() == [1]
+    assert tracker.tracks[0].hits == 2
+
+
+def test_track_sampler_skips_frames_while_stable(result):
+    tracker = ByteTracker(min_hits=1, stable_frames=3)
+    sampler = TrackSampler(tracker, every=4)
+    detected = []
+    for t in range(20):
+        detect = sampler.should_detect(None)
+        detected.append(detect)
+        if detect:
+            tracker.update(t, result([[100, 100, 150, 150, 0.9, 0]]))
+    # Every frame until the track has been stable for 3 frames, then every 4th
+    assert detected[:4] == [True] * 4
+    assert sum(detected) < len(detected) / 2
@@ -0,0 +1,102 @@
+import numpy as np
+
+from detection import predict_batch
+
+
+def add_speed(total, speed):
+    for k, v in speed.items():
+        total[k] = total.get(k, 0.0) + (v or 0.0)
+
+
+def tile_starts(length, tile_size, stride):
+    # Evenly stepped tile offsets with the last tile flush against the edge
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+
+class Tiler:
+    # Sliced inference for frames much larger than the model input. Frames
+    # are cut into overlapping tiles, all tiles of all frames are batched
+    # through the model, and boxes are shifted back and merged with NMS.
+    # With prepass_imgsz set, a cheap low-resolution pass over the whole frame
+    # runs first and only tiles near its candidate boxes are run at full res.
+    def __init__(self, tile_size=640, overlap=0.2, batch_size=8, prepass_imgsz=None, prepass_conf=0.05, margin=64):
+        self.tile_size = tile_size
+        self.stride = max(1, int(tile_size * (1 - overlap)))
+        self.batch_size = max(1, int(batch_size))
+        self.prepass_imgsz = prepass_imgsz
+        self.prepass_conf = prepass_conf
+        self.margin = margin
+
+    def tiles(self, width, height):
+        return np.array([
+            (x, y, min(x + self.tile_size, width), min(y + self.tile_size, height))
+            for y in tile_starts(height, self.tile_size, self.stride)
+            for x in tile_starts(width, self.tile_size, self.stride)
+        ])
+
+    def select_tiles(self, tiles, candidates):
+        # Keep tiles overlapping any candidate box grown by the margin
+        if not len(candidates):
+            return tiles[:0]
+        grown = candidates + np.array([-1, -1, 1, 1]) * self.margin
+        overlap = (
+            (tiles[:, None, 0] < grown[None, :, 2]) & (tiles[:, None, 2] > grown[None, :, 0])
+            & (tiles[:, None, 1] < grown[None, :, 3]) & (tiles[:, None, 3] > grown[None, :, 1])
+        )
+        return tiles[overlap.any(1)]
+
+    def predict(self, model, frames, conf_threshold, iou_threshold):
+        import torch
+        from torchvision.ops import batched_nms
+        from ultralytics.engine.results import Results
+
+        prepass = [None] * len(frames)
+        if self.prepass_imgsz:
+            prepass = predict_batch(model, frames, self.prepass_conf, iou_threshold, imgsz=self.prepass_imgsz)
+
+        # (frame index, x offset, y offset, crop) for every tile to run
+        crops = []
+        for i, frame in enumerate(frames):
+            tiles = self.tiles(frame.shape[1], frame.shape[0])
+            if prepass[i] is not None:
+                tiles = self.select_tiles(tiles, prepass[i].boxes.xyxy.cpu().numpy())
+            for x1, y1, x2, y2 in tiles:
+                crops.append((i, x1, y1, frame[y1:y2, x1:x2]))
+
+        detections = [[] for _ in frames]
+        speed = {}
+        names = model.names
+        for start in range(0, len(crops), self.batch_size):
+            chunk = crops[start:start + self.batch_size]
+            res = predict_batch(model, [crop for _, _, _, crop in chunk], conf_threshold, iou_threshold, imgsz=self.tile_size)
+            for (i, x, y, _), r in zip(chunk, res):
+                boxes = r.boxes.data.clone()
+                boxes[:, [0, 2]] += x
+                boxes[:, [1, 3]] += y
+                detections[i].append(boxes)
+                add_speed(speed, r.speed)
+
+        results = []
+        for i, frame in enumerate(frames):
+            # Confident pre-pass boxes count too: large fires can span tiles
+            if prepass[i] is not None:
+                boxes = prepass[i].boxes.data
+                detections[i].append(boxes[boxes[:, 4] >= conf_threshold])
+                add_speed(speed, prepass[i].speed)
+
+            boxes = torch.cat(detections[i]) if detections[i] else torch.zeros((0, 6))
+            if len(boxes):
+                keep = batched_nms(boxes[:, :4], boxes[:, 4], boxes[:, 5].long(), iou_threshold)
+                boxes = boxes[keep]
+
+            results.append(Results(orig_img=frame, path="", names=names, boxes=boxes))
+
+        # Spread the total time over the frames like a batched predict does
+        for r in results:
+            r.speed = {k: v / len(frames) for k, v in speed.items()}
+
+        return results
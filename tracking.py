@@ -0,0 +1,176 @@
+import numpy as np
+
+from detection import box_iou
+
+
+class Track:
+    def __init__(self, track_id, box, conf, cls, index):
+        self.id = track_id
+        self.box = box
+        self.velocity = np.zeros(4)
+        self.cls = cls
+        self.conf = conf
+        self.max_conf = conf
+        self.conf_sum = conf
+        self.hits = 1
+        self.first_seen = index
+        self.last_seen = index
+
+    def predicted(self, index):
+        # Constant-velocity guess of where the box is at frame index
+        return self.box + self.velocity * (index - self.last_seen)
+
+    def update(self, box, conf, index, smoothing):
+        step = max(1, index - self.last_seen)
+        self.velocity = (box - self.box) / step
+        self.box = box
+        self.conf = smoothing * self.conf + (1 - smoothing) * conf
+        self.max_conf = max(self.max_conf, conf)
+        self.conf_sum += conf
+        self.hits += 1
+        self.last_seen = index
+
+    def to_dict(self, fps, names):
+        return {
+            "id": self.id,
+            "class": names[self.cls],
+            "first_seen": round(self.first_seen / fps, 3),
+            "last_seen": round(self.last_seen / fps, 3),
+            "frames": self.hits,
+            "max_conf": round(self.max_conf, 4),
+            "mean_conf": round(self.conf_sum / self.hits, 4),
+        }
+
+
+def match(tracks, boxes, classes, index, min_iou):
+    # Greedy IoU association between tracks (at their predicted position) and
+    # boxes of the same class; returns matched pairs and the leftovers
+    if not tracks or not len(boxes):
+        return [], list(range(len(tracks))), list(range(len(boxes)))
+
+    iou = box_iou(np.stack([t.predicted(index) for t in tracks]), boxes)
+    iou[np.array([t.cls for t in tracks])[:, None] != classes[None, :]] = 0
+
+    pairs = []
+    for flat in np.argsort(-iou, axis=None):
+        t, d = np.unravel_index(flat, iou.shape)
+        if iou[t, d] < min_iou:
+            break
+        if all(t != pt and d != pd for pt, pd in pairs):
+            pairs.append((t, d))
+    matched_tracks = {t for t, _ in pairs}
+    matched_boxes = {d for _, d in pairs}
+    return (
+        pairs,
+        [t for t in range(len(tracks)) if t not in matched_tracks],
+        [d for d in range(len(boxes)) if d not in matched_boxes],
+    )
+
+
+class ByteTracker:
+    # ByteTrack-style association of fire/smoke boxes across frames. Boxes
+    # at or above high_thresh are matched to tracks first; tracks left over
+    # then get a second chance with the low-confidence boxes (down to
+    # low_thresh), which keeps a flickering fire on one id instead of
+    # starting a new one. Only high-confidence boxes start tracks, and a
+    # track is reported once it has been seen in min_hits frames, so
+    # one-frame false positives never show up. A track survives max_missed
+    # frames without a match and is drawn for hold of them.
+    def __init__(self, high_thresh=0.5, low_thresh=0.1, match_iou=0.3, min_hits=3, max_missed=30, hold=3,
+                 smoothing=0.7, stable_frames=15):
+        self.high_thresh = high_thresh
+        self.low_thresh = low_thresh
+        self.match_iou = match_iou
+        self.min_hits = min_hits
+        self.max_missed = max_missed
+        self.hold = hold
+        self.smoothing = smoothing
+        self.stable_frames = stable_frames
+        self.names = {}
+        self.tracks = []
+        self.finished = []
+        self.next_id = 1
+        self.changed_at = 0
+        self.index = 0
+
+    @property
+    def stable(self):
+        # No track confirmed or lost for stable_frames frames
+        return self.index - self.changed_at >= self.stable_frames
+
+    def update(self, index, r):
+        # Feed one detected frame; returns a copy of r whose boxes are the
+        # confirmed tracks, carrying track ids and smoothed confidences
+        self.index = index
+        self.names = r.names
+        data = r.boxes.data.cpu().numpy()
+        boxes, confs, classes = data[:, :4], data[:, -2], data[:, -1].astype(int)
+        high = np.flatnonzero(confs >= self.high_thresh)
+        low = np.flatnonzero((confs < self.high_thresh) & (confs >= self.low_thresh))
+
+        pairs, left, new = match(self.tracks, boxes[high], classes[high], index, self.match_iou)
+        for t, d in pairs:
+            self._update(self.tracks[t], boxes[high[d]], confs[high[d]], index)
+
+        leftover = [self.tracks[t] for t in left]
+        pairs, _, _ = match(leftover, boxes[low], classes[low], index, self.match_iou)
+        for t, d in pairs:
+            self._update(leftover[t], boxes[low[d]], confs[low[d]], index)
+
+        for d in new:
+            i = high[d]
+            self.tracks.append(Track(self.next_id, boxes[i], float(confs[i]), int(classes[i]), index))
+            self.next_id += 1
+
+        alive = []
+        for track in self.tracks:
+            if index - track.last_seen <= self.max_missed:
+                alive.append(track)
+            elif track.hits >= self.min_hits:
+                self.finished.append(track)
+                self.changed_at = index
+        self.tracks = alive
+
+        return self.result(r, index)
+
+    def _update(self, track, box, conf, index):
+        track.update(box, float(conf), index, self.smoothing)
+        if track.hits == self.min_hits:
+            self.changed_at = index
+
+    def result(self, r, index):
+        import torch
+
+        shown = [
+            t for t in self.tracks
+            if t.hits >= self.min_hits and index - t.last_seen <= self.hold
+        ]
+        data = torch.tensor(
+            [[*t.predicted(index), t.id, t.conf, t.cls] for t in shown], dtype=torch.float32,
+        ).reshape(-1, 7)
+        tracked = type(r)(orig_img=r.orig_img, path=r.path, names=r.names, boxes=data)
+        tracked.speed = r.speed
+        return tracked
+
+    def summary(self, fps):
+        # First/last seen (in seconds), length and confidence of every
+        # confirmed track, finished or still running
+        fps = fps or 30
+        tracks = self.finished + [t for t in self.tracks if t.hits >= self.min_hits]
+        return [t.to_dict(fps, self.names) for t in sorted(tracks, key=lambda t: t.id)]
+
+
+class TrackSampler:
+    # Frame sampler for process_video that runs the model on every frame
+    # while tracks are changing and only on every k-th frame once they are
+    # stable; skipped frames keep the last tracked boxes. The decoder runs a
+    # few batches ahead of the tracker, so it reacts with that much delay.
+    def __init__(self, tracker, every=5):
+        self.tracker = tracker
+        self.every = max(1, int(every))
+        self.since_detect = 0
+
+    def should_detect(self, frame):
+        detect = not self.tracker.stable or self.since_detect + 1 >= self.every
+        self.since_detect = 0 if detect else self.since_detect + 1
+        return detect